@@ -0,0 +1,230 @@
+""" Benchmarks for the parsing, merging and rendering hot paths, on synthetic cluster data
+
+    python bench/bench_esconsole.py --sizes 1000,10000
+    python bench/bench_esconsole.py --save before.json
+    python bench/bench_esconsole.py --baseline before.json --tolerance 0.25
+    python bench/bench_esconsole.py --cases http_refresh --latency 0.2
+
+Each case is timed (best of --repeat runs) and run once more under tracemalloc for its peak
+memory. The run fails (exit status 1) if a case is more than --tolerance slower / bigger than in
+--baseline, or over its limit in --thresholds. Compare against a baseline saved on the same
+machine to catch regressions. The thresholds are only a backstop: 2.5x the slowest of three --save
+runs when last calibrated (at least 0.05s) and 1.5x their peak memory, to stay clear of run to run
+noise. Recalibrate the same way when they drift.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import elasticsearch
+
+try:
+    import tracemalloc
+except ImportError:
+    # python 2, no memory numbers
+    tracemalloc = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from esconsole import esconsole
+from esconsole import synthetic
+from esconsole import statefile
+from esconsole import fakeserver
+
+SCREEN_SIZE = (200, 60)
+
+# Only run when asked for with --cases, they are slow on big sizes
+OPT_IN_CASES = ['http_refresh']
+
+
+class SyntheticCat(object):
+    """ Answers cat calls the way the elasticsearch client does for format=json. Responses are
+    generated up front so generating them isn't part of what gets measured. """
+    def __init__(self, indices_rows, segments_rows):
+        self.indices_rows = indices_rows
+        self.segments_rows = segments_rows
+
+    def indices(self, **kwargs):
+        return self.indices_rows
+
+    def segments(self, **kwargs):
+        return self.segments_rows
+
+
+class SyntheticES(object):
+    def __init__(self, indices_rows, segments_rows):
+        self.cat = SyntheticCat(indices_rows, segments_rows)
+
+
+class BenchMain(object):
+    """ What IndicesListWidget needs of MainScreenWidget """
+    def __init__(self):
+        self.status_line = esconsole.StatusLineWidget()
+
+
+def cases(cluster, latency=0.0):
+    """ (name, setup) pairs, setup returns the function to measure so input prep isn't timed """
+    indices_rows = cluster.cat_indices_json()
+    indices_text = cluster.cat_indices_text()
+    segments_rows = cluster.cat_segments_json(esconsole.CatSegmentsResponseLine.columns)
+    es = SyntheticES(indices_rows, segments_rows)
+
+    def cat_indices_json():
+        return lambda: esconsole.CatIndicesResponse(indices_rows)
+
+    def cat_indices_text():
+        return lambda: esconsole.CatIndicesResponse(indices_text)
+
+    def cat_segments_json():
+        return lambda: esconsole.CatSegmentsResponse(segments_rows)
+
+    def indices_info():
+        indices = esconsole.CatIndicesResponse(indices_rows)
+        segments = esconsole.CatSegmentsResponse(segments_rows)
+        return lambda: esconsole.IndicesInfo(indices, segments)
+
+    def list_widget():
+        info = esconsole.fetch_indices_info(es)
+        return lambda: esconsole.MultiSelectListWidget(info).render(SCREEN_SIZE, focus=True)
+
+    def sort_all():
+        widget = esconsole.MultiSelectListWidget(esconsole.fetch_indices_info(es))
+        return lambda: widget.sort('store_size', True)
+
+    def top_n():
+        widget = esconsole.MultiSelectListWidget(esconsole.fetch_indices_info(es))
+        return lambda: widget.sort('store_size', True, esconsole.TOP_N)
+
+    def rollup():
+        info = esconsole.fetch_indices_info(es)
+        return lambda: esconsole.IndicesRollup(info)
+
+    def load_state():
+        path = os.path.join(tempfile.gettempdir(), "esconsole-bench.state")
+        statefile.save_state(path, esconsole.fetch_indices_info(es))
+        return lambda: statefile.load_state(path)
+
+    def refresh_cycle():
+        widget = esconsole.IndicesListWidget(BenchMain(), es, esconsole.fetch_indices_info(es))
+        def refresh():
+            widget.update(esconsole.fetch_indices_info(es))
+            widget.render(SCREEN_SIZE, focus=True)
+        return refresh
+
+    def http_refresh():
+        # the full path, http and json decoding included, against the fake server
+        server = fakeserver.FakeServer(fakeserver.FakeCluster(cluster, faults=fakeserver.Faults(latency=latency))).start()
+        client = elasticsearch.Elasticsearch([server.address], timeout=600)
+        widget = esconsole.IndicesListWidget(BenchMain(), client, esconsole.fetch_indices_info(client))
+        def refresh():
+            widget.update(esconsole.fetch_indices_info(client))
+            widget.render(SCREEN_SIZE, focus=True)
+        return refresh
+
+    return [
+        ('cat_indices_json', cat_indices_json),
+        ('cat_indices_text', cat_indices_text),
+        ('cat_segments_json', cat_segments_json),
+        ('indices_info', indices_info),
+        ('list_widget', list_widget),
+        ('sort_all', sort_all),
+        ('top_n', top_n),
+        ('rollup', rollup),
+        ('load_state', load_state),
+        ('refresh_cycle', refresh_cycle),
+        ('http_refresh', http_refresh),
+    ]
+
+
+def measure(setup, repeat):
+    best = None
+    for n in range(repeat):
+        func = setup()
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    peak_mb = None
+    if tracemalloc is not None:
+        func = setup()
+        tracemalloc.start()
+        func()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_mb = peak / 1e6
+    return best, peak_mb
+
+
+def check(name, result, limits, tolerance=0.0):
+    """ Problems with result compared to limits ({seconds, peak_mb}) """
+    problems = []
+    for field, unit in (('seconds', 's'), ('peak_mb', 'MB')):
+        if limits.get(field) is None or result.get(field) is None:
+            continue
+        allowed = limits[field] * (1 + tolerance)
+        if result[field] > allowed:
+            problems.append("%s: %s %.3f%s over %.3f%s" % (name, field, result[field], unit, allowed, unit))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="esconsole benchmarks on synthetic data")
+    parser.add_argument('--sizes', default="1000,10000", help="comma separated index counts")
+    parser.add_argument('--max-segments', type=int, default=20, help="most segments per shard copy")
+    parser.add_argument('--closed-ratio', type=float, default=0.05)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--cases', default=None, help="comma separated case names, default all but %s" % (",".join(OPT_IN_CASES)))
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds the fake server adds per request, for http_refresh")
+    parser.add_argument('--thresholds', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "thresholds.json"))
+    parser.add_argument('--save', default=None, help="write results as json here")
+    parser.add_argument('--baseline', default=None, help="results saved from an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed regression against --baseline, 0.25 = 25%%")
+    args = parser.parse_args(argv)
+
+    thresholds = {}
+    if args.thresholds and os.path.exists(args.thresholds):
+        with open(args.thresholds) as fh:
+            thresholds = json.load(fh)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+
+    results = {}
+    problems = []
+    print("%-20s %8s %10s %10s %10s" % ("case", "indices", "segments", "seconds", "peak MB"))
+    for size in [int(s) for s in args.sizes.split(",")]:
+        cluster = synthetic.SyntheticCluster(size, closed_ratio=args.closed_ratio, max_segments=args.max_segments)
+        segment_rows = sum(1 for row in cluster.segment_rows())
+        for name, setup in cases(cluster, args.latency):
+            if args.cases and name not in args.cases.split(","):
+                continue
+            if not args.cases and name in OPT_IN_CASES:
+                continue
+            seconds, peak_mb = measure(setup, args.repeat)
+            key = "%s/%d" % (name, size)
+            results[key] = {'seconds': seconds, 'peak_mb': peak_mb}
+            print("%-20s %8d %10d %10.3f %10s" % (name, size, segment_rows, seconds, "-" if peak_mb is None else "%.1f" % (peak_mb)))
+            sys.stdout.flush()
+
+            if key in thresholds:
+                problems.extend(check(key, results[key], thresholds[key]))
+            if key in baseline:
+                problems.extend(check(key + " vs baseline", results[key], baseline[key], args.tolerance))
+
+    if args.save:
+        with open(args.save, "w") as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+
+    for problem in problems:
+        print("REGRESSION %s" % (problem))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
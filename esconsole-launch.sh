@@ -2,4 +2,4 @@
 
 cd /opt/esconsole
 export PYTHONPATH=venv/bin/python2.7/lib
-./venv/bin/python esconsole/esconsole.py
+./venv/bin/python esconsole/esconsole.py "$@"
@@ -1,74 +1,275 @@
+import sys
+
+if __name__ == "__main__" and "--report" in sys.argv[1:]:
+    # headless, skip importing urwid and everything else the console needs
+    from report import main
+    sys.exit(main())
+
 import urwid
 import elasticsearch
-import sys
+import os
 import re
 import time
+import heapq
 import threading
-import datetime
-import itertools
+import argparse
+import collections
+from elasticsearch.serializer import JSONSerializer
+
+try:
+    from .indexdata import (
+        SHOW_TREND, CatIndicesResponse, CatSegmentsResponse, IndicesInfo, IndicesRollup, SnapshotStore, DetailCache,
+        byte_format, fetch_cat_health, fetch_indices_info, fetch_index_detail, next_time_bins, parse_scope, parse_cluster)
+    # not used here, the tests and bench reach them as esconsole.X
+    from .indexdata import (
+        HISTORY_SIZE, CatIndicesResponseLine, CatSegmentsResponseLine, CatHealthResponseLine, IndexInfo, IndexHistory,
+        IndexDetail, index_naming, fetch_cat_segments, scope_index)
+    from .statefile import load_state, save_state, state_path
+    from .timings import Timings, note_response_size
+    from .optimize import OptimizeScheduler
+except (ImportError, ValueError):
+    # run as a script
+    from indexdata import (
+        SHOW_TREND, CatIndicesResponse, CatSegmentsResponse, IndicesInfo, IndicesRollup, SnapshotStore, DetailCache,
+        byte_format, fetch_cat_health, fetch_indices_info, fetch_index_detail, next_time_bins, parse_scope, parse_cluster)
+    # not used here, the tests and bench reach them as esconsole.X
+    from indexdata import (
+        HISTORY_SIZE, CatIndicesResponseLine, CatSegmentsResponseLine, CatHealthResponseLine, IndexInfo, IndexHistory,
+        IndexDetail, index_naming, fetch_cat_segments, scope_index)
+    from statefile import load_state, save_state, state_path
+    from timings import Timings, note_response_size
+    from optimize import OptimizeScheduler
+
+# Clusters shown when none are given on the command line, (name, hosts)
+CLUSTERS=[("localhost:9200", ["localhost:9200"])]
+
+# Seconds before a request to a cluster gives up, so a dead cluster shows as unreachable
+ES_TIMEOUT=30
 
 # Run /_cat/health every this many seconds
 HEALTH_UPDATE_FREQ=3
 
-debug = False
-if debug:
-    debug_fh = open("debug.txt", "w")
+# Refresh the indices of every cluster, not just the current tab, every this many seconds so the
+# header totals keep moving. None only refreshes on space.
+INDICES_UPDATE_FREQ=60
+
+# Number of list row widgets kept around the focus, the rest are built on demand
+ROW_CACHE_SIZE=200
+
+# Admin operations put several comma separated indices in one request path, up to about this many characters
+MAX_MULTI_INDEX_LENGTH=3000
+
+# Fetch cat segments of the whole cluster on every refresh, for the segments column. Turn off
+# (--no-segments) on clusters with lots of segments, enter still shows them per index.
+FETCH_SEGMENTS=True
+
+# Index patterns (-pattern excludes) the server is asked for on refresh, eg ["logstash-2026.10.*"].
+# Empty fetches every index. Set with --scope or S.
+SCOPE=[]
+
+# T shows this many rows of the sort order, by default the largest indices by store size
+TOP_N=20
+TOP_N_SORT='store_size'
+
+# A on a time based index offers to create this many upcoming time bins of its family
+PRECREATE_BINS=7
+
+# Where the stats popup (p) dumps refresh timings
+TIMINGS_DIR=os.path.expanduser("~/.esconsole/timings")
+
+# debug() appends here when set, eg ESCONSOLE_DEBUG=debug.txt
+DEBUG_FILE=os.environ.get("ESCONSOLE_DEBUG")
+debug_fh = None
+
 def debug(s):
     global debug_fh
+    if not DEBUG_FILE:
+        return
+    if debug_fh is None:
+        debug_fh = open(DEBUG_FILE, "a")
     debug_fh.write(str(s))
     debug_fh.write("\n")
     debug_fh.flush()
 
-def byte_format(num):
-    if num is None or num == "":
-        return ""
-    num = float(num)
-    for suffix in ['b', 'kb', 'mb', 'gb', 'tb', 'pb']:
-        if num < 1000:
-            if suffix == 'b':
-                return "%6d%s" % (num, suffix)
-            formatted = "%5.1f" % (num)
-            whole, decimal = formatted.split(".")
-            if decimal == "0":
-                return "  %s%s" % (whole, suffix)
-            return "%s%s" % (formatted, suffix)
-        num = num / 1000
+class CountingJSONSerializer(JSONSerializer):
+    """ Notes the size of every response for the refresh timings """
+    def loads(self, s):
+        note_response_size(len(s))
+        return super(CountingJSONSerializer, self).loads(s)
+
+class MultiSelectListWalker(urwid.ListWalker):
+    """ Builds row widgets only when the ListBox asks for them and keeps the most recently shown ones
+
+    Widgets are cached by row key rather than position so they survive rows being inserted or removed. """
+    def __init__(self, size, row_key, make_row, cache_size=ROW_CACHE_SIZE):
+        self.size = size
+        self.row_key = row_key
+        self.make_row = make_row
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.focus = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, pos):
+        if pos < 0 or pos >= self.size:
+            raise IndexError(pos)
+        key = self.row_key(pos)
+        widget = self.cache.pop(key, None)
+        if widget is None:
+            widget = self.make_row(pos)
+            if len(self.cache) >= self.cache_size:
+                self.cache.popitem(last=False)
+        # most recently used go last
+        self.cache[key] = widget
+        return widget
+
+    def cached(self, key):
+        """ The widget for key if it has been built, None otherwise """
+        return self.cache.get(key)
+
+    def update(self, size, focus, stale_keys=None):
+        """ Rows changed; drop widgets for stale_keys (or all of them if None) and redraw """
+        if stale_keys is None:
+            self.cache.clear()
+        else:
+            for key in stale_keys:
+                self.cache.pop(key, None)
+        self.size = size
+        self.focus = max(0, min(focus, size - 1))
+        self._modified()
+
+    def get_focus(self):
+        if self.size == 0:
+            return None, None
+        return self[self.focus], self.focus
+
+    def set_focus(self, pos):
+        if pos < 0 or pos >= self.size:
+            raise IndexError(pos)
+        self.focus = pos
+        self._modified()
+
+    def next_position(self, pos):
+        if pos + 1 >= self.size:
+            raise IndexError(pos + 1)
+        return pos + 1
+
+    def prev_position(self, pos):
+        if pos <= 0:
+            raise IndexError(pos - 1)
+        return pos - 1
+
+    def positions(self, reverse=False):
+        if reverse:
+            return range(self.size - 1, -1, -1)
+        return range(self.size)
+
+
+# Characters that can widen what a regex matches when appended to it
+REGEX_WIDENING_CHARS = set("*+?{}|()[]\\^$")
+
+# Compiled filter regexes, typing a filter compiles one per keystroke
+FILTER_PATTERN_CACHE_SIZE=64
+filter_patterns = {}
+
+def compile_filter(filter_text):
+    pattern = filter_patterns.get(filter_text)
+    if pattern is None:
+        if len(filter_patterns) >= FILTER_PATTERN_CACHE_SIZE:
+            filter_patterns.clear()
+        pattern = filter_patterns[filter_text] = re.compile(filter_text)
+    return pattern
+
+def filter_narrows(old_text, new_text):
+    """ True if everything new_text matches is known to match old_text as well, ie new_text is
+    old_text with some plain characters appended. Then only old_text's matches need rescanning. """
+    if old_text == "" or not new_text.startswith(old_text):
+        return False
+    return not (set(new_text[len(old_text):]) & REGEX_WIDENING_CHARS)
+
+class SelectionModel(object):
+    """ The selected rows, by key. This is the source of truth the row widgets are drawn from.
+
+    Keys rather than positions, so the selection survives refreshes, filtering and reordering. """
+    def __init__(self):
+        self.keys = set()
+        # one end of a range selection
+        self.mark = None
+
+    def toggle(self, key):
+        """ Returns whether key is selected afterwards """
+        if key in self.keys:
+            self.keys.discard(key)
+            return False
+        self.keys.add(key)
+        return True
+
+    def select(self, keys):
+        self.keys.update(keys)
+
+    def clear(self):
+        self.keys.clear()
+
+    def set_mark(self, key):
+        self.mark = key
+
+    def retain(self, existing):
+        """ Forget keys that are not in existing anymore """
+        self.keys = set(key for key in self.keys if key in existing)
+        if self.mark not in existing:
+            self.mark = None
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        return iter(self.keys)
+
 
 class MultiSelectListWidget(urwid.WidgetWrap):
     """ This widget implements generic selection and filtering on a list of passed in data. """
     def __init__(self, listdata):
-        # listdata should be array-ish and also implement a .headers property
+        # listdata should be array-ish and also implement a .headers property and a
+        # .key(row) method returning something unique and stable for a row across updates.
+        # Rows implement .values(headers), returning the raw values of a row,
+        # .format_value(header, value), turning one of those into display text, and
+        # .sort_value(header, value), what it sorts by (None for nothing to sort by).
+        # listdata may also have .parents, {key: parent key} of rows that belong under another
+        # row. They follow their parent when sorted and stay selected while hidden.
         self.listdata = listdata
+        self.selection = SelectionModel()
+        self.keys = []
+        self.positions = {}
+        self.headers = None
+        # per key, the raw values and the formatted cells and sort values made from them
+        self.values = {}
+        self.cells = {}
+        self.sort_values = {}
+        # per column, how many rows have a cell of each width
+        self.width_counts = {}
+        self.col_width = {}
+        # column the rows are sorted by, None for listdata order, and how many to show of them
+        self.sort_header = None
+        self.sort_reverse = False
+        self.top_n = None
+        self.load(listdata)
+
+        # keys of the rows passing the filter, in listdata order, and the ones shown in the
+        # order they are shown
+        self.filter_text = ""
+        self.matched = self.keys
+        self.visible = self.keys
 
-        # determine how wide each column should be
-        col_width = {}
-        for h in self.listdata.headers:
-            col_width[h] = len(h)
-        for row in self.listdata:
-            for h in self.listdata.headers:
-                val = row.format(h)
-                if len(str(val)) > col_width[h]:
-                    col_width[h] = len(str(val))
-
-
-        # format each row
-        buttons = []
-        for row in self.listdata:
-            el = []
-            for h in self.listdata.headers:
-                padding = col_width[h] - len(str(row.format(h)))
-                el.append(str(row.format(h)) + (" " * padding))
-            buttons.append(urwid.AttrMap(urwid.Button(" | ".join(el)), None, focus_map=None))
-
-        # format headers
-        hdr_txt = []
-        for h in self.listdata.headers:
-            padding = col_width[h] - len(h)
-            hdr_txt.append(h + " " * padding)
-
+        self.header_text = urwid.Text(self.format_header())
         # reverse video for headers
-        header_widget = urwid.AttrMap(urwid.Text("  " + "   ".join(hdr_txt)), 'reversed')
-        self.listbox = urwid.ListBox(urwid.SimpleFocusListWalker(buttons))
+        header_widget = urwid.AttrMap(self.header_text, 'reversed')
+        self.walker = MultiSelectListWalker(len(self.visible), self.key_at, self.make_row)
+        self.listbox = urwid.ListBox(self.walker)
         pile = urwid.Pile([
             ('pack', header_widget),
             ('weight', 1, self.listbox)
@@ -76,267 +277,464 @@ class MultiSelectListWidget(urwid.WidgetWrap):
 
         super(MultiSelectListWidget, self).__init__(pile)
 
+    def load(self, listdata):
+        """ Work out the cells of every row. Rows whose raw values are unchanged keep their formatted
+        cells, only the others are formatted. Returns the keys whose cells differ from before, or None
+        if a column changed width and everything needs redrawing. """
+        headers = list(listdata.headers)
+        if headers != self.headers:
+            # different columns, nothing cached applies
+            self.headers = headers
+            self.values, self.cells, self.sort_values = {}, {}, {}
+            self.width_counts = dict((h, collections.Counter()) for h in headers)
+            if self.sort_header not in headers:
+                self.sort_header = None
+        old_values, old_cells, old_sort_values = self.values, self.cells, self.sort_values
+        self.listdata = listdata
+        self.keys = []
+        self.positions = {}
+        self.values, self.cells, self.sort_values = {}, {}, {}
+        changed = []
+        for ndx, row in enumerate(listdata):
+            key = listdata.key(row)
+            values = row.values(headers)
+            if key in old_values and old_values[key] == values:
+                cells = old_cells[key]
+                sort_values = old_sort_values[key]
+            else:
+                sort_values = tuple(row.sort_value(h, v) for h, v in zip(headers, values))
+                # text, not str, the trend sparkline isn't ascii and python 2 can't str() it
+                cells = tuple(u"%s" % (row.format_value(h, v),) for h, v in zip(headers, values))
+                if key in old_cells:
+                    self.count_widths(old_cells[key], -1)
+                    if old_cells[key] == cells:
+                        cells = old_cells[key]
+                    else:
+                        changed.append(key)
+                else:
+                    changed.append(key)
+                self.count_widths(cells, 1)
+            self.keys.append(key)
+            self.positions[key] = ndx
+            self.values[key] = values
+            self.cells[key] = cells
+            self.sort_values[key] = sort_values
+        for key in old_cells:
+            if key not in self.cells:
+                self.count_widths(old_cells[key], -1)
+                changed.append(key)
+        parents = getattr(listdata, 'parents', None)
+        self.selection.retain(self.positions if not parents else set(self.positions).union(parents))
+
+        # widths are the running maxima of the width counts
+        col_width = {}
+        for h in headers:
+            counts = self.width_counts[h]
+            col_width[h] = max([len(h)] + [w for w, n in counts.items() if n > 0])
+        widths_changed = col_width != self.col_width
+        self.col_width = col_width
+        if widths_changed:
+            return None
+        return changed
+
+    def count_widths(self, cells, delta):
+        for h, val in zip(self.headers, cells):
+            self.width_counts[h][len(val)] += delta
+
+    def update(self, listdata):
+        """ Swap in new listdata. Only rows that were added or whose cells changed get new widgets,
+        focus and selection stay on the same keys and the filter stays applied. """
+        focus_key = self.focus_key()
+        changed = self.load(listdata)
+        if changed is None:
+            self.header_text.set_text(self.format_header())
+
+        if self.filter_text == "":
+            self.matched = self.keys
+        else:
+            # unchanged rows keep their match result, only added and changed rows are matched again
+            pattern = compile_filter(self.filter_text)
+            matched = set(self.matched)
+            for key in (self.keys if changed is None else changed):
+                if key in self.cells and self.matches(pattern, key):
+                    matched.add(key)
+                else:
+                    matched.discard(key)
+            self.matched = [key for key in self.keys if key in matched]
+        self.visible = self.order(self.matched)
+        self.refocus(focus_key, changed)
+
+    def matches(self, pattern, key):
+        # cell by cell, so ^ and $ anchor to a value, eg ^logstash to the index name
+        return any(pattern.search(cell) for cell in self.cells[key])
+
     def filter(self, filter_text):
+        """ Show only rows where filter_text (a python regex) matches one of the row's cells.
+        Raises re.error on an invalid regex and leaves the current filter alone. """
+        pattern = compile_filter(filter_text)
+        focus_key = self.focus_key()
         if filter_text == "":
-            filter_text = ".*"
-        filter_re = re.compile(filter_text)
-
+            self.matched = self.keys
+        else:
+            if filter_narrows(self.filter_text, filter_text):
+                candidates = self.matched
+            else:
+                candidates = self.keys
+            self.matched = [key for key in candidates if self.matches(pattern, key)]
+        self.filter_text = filter_text
+        self.visible = self.order(self.matched)
+        self.refocus(focus_key, [])
+
+    def sort(self, header, reverse=False, top_n=None):
+        """ Show rows sorted by header, None for listdata order. With top_n only the first top_n
+        of them, picked with a heap rather than sorting every row. """
+        focus_key = self.focus_key()
+        self.sort_header = header if header in self.headers else None
+        self.sort_reverse = reverse
+        self.top_n = top_n
+        self.visible = self.order(self.matched)
+        self.refocus(focus_key, [])
+
+    def order(self, keys):
+        """ keys in the sort order, rows with nothing to sort by last. Rows under a parent that is
+        in keys follow it, in listdata order. """
+        if self.sort_header is None:
+            return keys
+        parents = getattr(self.listdata, 'parents', None)
+        children = collections.defaultdict(list)
+        if parents:
+            shown = set(keys)
+            top = []
+            for key in keys:
+                if parents.get(key) in shown:
+                    children[parents[key]].append(key)
+                else:
+                    top.append(key)
+            keys = top
+        ordered = self.sort_keys(keys)
+        if not children:
+            return ordered
+        return [k for key in ordered for k in [key] + children.get(key, [])]
+
+    def sort_keys(self, keys):
+        column = self.headers.index(self.sort_header)
+        sort_values = self.sort_values
+        sort_key = lambda key: sort_values[key][column]
+        present = [key for key in keys if sort_values[key][column] is not None]
+        missing = [key for key in keys if sort_values[key][column] is None]
+        if self.top_n is None:
+            return sorted(present, key=sort_key, reverse=self.sort_reverse) + missing
+        pick = heapq.nlargest if self.sort_reverse else heapq.nsmallest
+        return (pick(self.top_n, present, key=sort_key) + missing)[:self.top_n]
+
+    def refocus(self, focus_key, stale_keys):
+        visible_positions = dict((key, pos) for pos, key in enumerate(self.visible))
+        focus = visible_positions.get(focus_key, self.walker.focus)
+        self.walker.update(len(self.visible), focus, stale_keys)
+
+    def key_at(self, pos):
+        return self.visible[pos]
+
+    def focus_key(self):
+        if len(self.visible) == 0:
+            return None
+        return self.visible[self.walker.focus]
+
+    def format_header(self):
+        hdr_txt = []
+        for h in self.listdata.headers:
+            padding = self.col_width[h] - len(h)
+            hdr_txt.append(h + " " * padding)
+        return "  " + "   ".join(hdr_txt)
+
+    def make_row(self, pos):
+        """ Build the widget for a single row, called by the walker when the row scrolls into view """
+        key = self.visible[pos]
+        el = []
+        for h, val in zip(self.listdata.headers, self.cells[key]):
+            el.append(val + " " * (self.col_width[h] - len(val)))
+        widget = urwid.AttrMap(urwid.Button(" | ".join(el)), None, focus_map=None)
+        if key in self.selection:
+            widget.set_attr_map({None: 'reversed'})
+        return widget
+
+    def repaint_selection(self):
+        """ Bring the built row widgets in line with the selection """
+        for key, widget in self.walker.cache.items():
+            if key in self.selection:
+                widget.set_attr_map({None: 'reversed'})
+            else:
+                widget.set_attr_map({'reversed': None})
 
     def selected(self):
-        result = []
-        i = 0
-        for el in self.listbox.body:
-            if None in el.attr_map and el.attr_map[None] == 'reversed':
-                result.append(i)
-            i += 1
-        return result
+        """ Selected keys in listdata order, hidden ones where their parent is """
+        parents = getattr(self.listdata, 'parents', None) or {}
+        return sorted(self.selection, key=lambda key: self.positions[key] if key in self.positions else self.positions[parents[key]])
 
     def item_under_cursor(self):
-        return self.listbox.focus_position
+        """ listdata position of the focused row, or None if no rows are shown """
+        if len(self.visible) == 0:
+            return None
+        return self.positions[self.focus_key()]
 
     def keypress(self, size, key):
         if key == "v":
             # toggle selection
-            if None in self.listbox.focus.attr_map and self.listbox.focus.attr_map[None] == 'reversed':
-                self.listbox.focus.set_attr_map({'reversed': None})
+            if len(self.visible) == 0:
+                return
+            if self.selection.toggle(self.focus_key()):
+                self.walker[self.walker.focus].set_attr_map({None: 'reversed'})
             else:
-                self.listbox.focus.set_attr_map({None: 'reversed'})
+                self.walker[self.walker.focus].set_attr_map({'reversed': None})
+        elif key == 'm':
+            # mark one end of a range
+            if len(self.visible) == 0:
+                return
+            self.selection.set_mark(self.focus_key())
+        elif key == 'V':
+            # select from the mark to the cursor
+            if len(self.visible) == 0 or self.selection.mark is None:
+                return
+            ends = [self.walker.focus]
+            try:
+                ends.append(self.visible.index(self.selection.mark))
+            except ValueError:
+                # mark is filtered out
+                return
+            self.selection.select(self.visible[min(ends):max(ends) + 1])
+            self.repaint_selection()
+        elif key == '*':
+            # select everything the filter shows
+            self.selection.select(self.visible)
+            self.repaint_selection()
         elif key == 'c':
-            # clear all
-            for el in self.listbox.body:
-                if None in el.attr_map and el.attr_map[None] == 'reversed':
-                    el.set_attr_map({'reversed': None})
+            # clear all, only rows that have a widget need repainting
+            self.selection.clear()
+            self.repaint_selection()
         # vi style up/down
         elif key == 'k':
             return super(MultiSelectListWidget, self).keypress(size, 'up')
         elif key == 'j':
             return super(MultiSelectListWidget, self).keypress(size, 'down')
         elif key == 'g':
+            if len(self.visible) == 0:
+                return
             self.listbox.set_focus(0, 'below')
             return super(MultiSelectListWidget, self).keypress(size, None)
         elif key == 'G':
-            self.listbox.set_focus(len(self.listdata) - 1, 'above')
+            if len(self.visible) == 0:
+                return
+            self.listbox.set_focus(len(self.visible) - 1, 'above')
             return super(MultiSelectListWidget, self).keypress(size, None)
         else:
             return super(MultiSelectListWidget, self).keypress(size, key)
 
-class CatIndicesResponseLine(object):
-        def __init__(self, line):
-            self.line = line
-            hdrs = ['health', 'status', 'index', 'pri', 'rep', 'docs_count', 'docs_deleted', 'store_size', 'pri_store_size']
-            int_fields = set(['pri', 'rep', 'docs_count', 'docs_deleted', 'store_size', 'pri_store_size'])
-            # es 1.7 headers ^
-            # example lines
-            # green  open   2015-10-10t00:00:00.000z   5   0          0            0       720b           720b
-            #        close  2015-08-11t00:00:00.000z
-            for h in hdrs:
-                setattr(self, h, None)
-            fields = re.split(" +", line.strip())
-            if len(fields) == 2:
-                self.status, self.index = fields
-            else:
-                for h,f in zip(hdrs, fields):
-                    if h in int_fields:
-                        val = int(f)
-                    else:
-                        val = f
-                    setattr(self, h, val)
-
-        def __repr__(self):
-            return self.line
-
-class CatIndicesResponse(object):
-    """ Wrap Cat Indices Responses """
-    def __init__(self, cat_indices_result):
-        self.headers = ['health', 'status', 'index', 'pri', 'rep', 'docs_count', 'docs_deleted', 'store_size', 'pri_store_size']
-        self.indices = []
-
-        for line in cat_indices_result.rstrip().split("\n"):
-            self.indices.append(CatIndicesResponseLine(line))
-
-        self.indices = sorted(self.indices, key=lambda x: x.index)
-
-    def __len__(self):
-        return len(self.indices)
-
-    def __getitem__(self, ndx):
-        return self.indices[ndx]
-
-class CatSegmentsResponse(object):
-    """ Wrap Cat Segments Responses """
-    def __init__(self, cat_segments_result):
-        self.headers = ['index', 'shard', 'prirep', 'ip', 'segment', 'generation', 'docs_count', 'docs_deleted', 'size', 'size_memory', 'committed', 'searchable', 'version', 'compound']
-        self.segments = []
-
-        for line in cat_segments_result.rstrip().split("\n"):
-            self.segments.append(CatSegmentsResponseLine(line))
-
-    def __len__(self):
-        return len(self.segments)
-
-    def __getitem__(self, ndx):
-        return self.segments[ndx]
-
-class CatSegmentsResponseLine(object):
-        def __init__(self, line):
-            self.line = line
-            hdrs = ['index', 'shard', 'prirep', 'ip', 'segment', 'generation', 'docs_count', 'docs_deleted', 'size', 'size_memory', 'committed', 'searchable', 'version', 'compound']
-            int_fields = set(['shard', 'generation', 'docs_count', 'docs_deleted'])
-            # es 1.7 headers ^
-            # example
-            # index                    shard prirep ip           segment generation docs.count docs.deleted size size.memory committed searchable version compound
-            # 2015-10-05t00:00:00.000z 0     p      192.168.1.65 _1               1          1            0  2kb        3298 true      true       4.10.4  false
-
-            for h in hdrs:
-                setattr(self, h, None)
-            fields = re.split(" +", line.strip())
-            if len(fields) == 2:
-                self.status, self.index = fields
-            else:
-                for h,f in zip(hdrs, fields):
-                    if h in int_fields:
-                        val = int(f)
-                    else:
-                        val = f
-                    setattr(self, h, val)
-
-        def __repr__(self):
-            return self.line
-
-class IndexInfo(object):
-    """ Wraps CatIndicesResponseLine and provides additional info """
-    def __init__(self, cat_indices_info):
-        self.cat_indices_info = cat_indices_info
-        self.cat_segments_info = []
-        self.prev_state = None
-
-    def set_cat_segments_info(self, cat_segments_info):
-        self.cat_segments_info = cat_segments_info
-
-    def set_prev_state(self, prev_state):
-        self.prev_state = prev_state
-
-    def format(self, attr):
-        # format field names
-        if attr in ['pri_store_size', 'store_size']:
-            return byte_format(getattr(self, attr))
-        return getattr(self, attr)
-
-    @property
-    def age(self):
-        # return age in days
-        age_groups = re.match(r"^(\d+-\d+-\d+t\d+:\d+:\d+).(\d+z)$", self.cat_indices_info.index)
-        if age_groups is None:
-            return -1
-
-        tstamp, msec = age_groups.group(1,2)
-        try:
-            date = datetime.datetime.strptime(tstamp, "%Y-%m-%dt%H:%M:%S")
-            delta = datetime.datetime.now() - date
-            return delta.days
-        except Exception as e:
-            return -1
-
-    @property
-    def segments(self):
-        pri_segs = [s for s in self.cat_segments_info if s.prirep == 'p' and s.committed == 'true']
-        unique_segs_per_shard = set()
-
-        for k, g in itertools.groupby(pri_segs, key=lambda x:x.shard):
-            unique_segs_per_shard.add(len(list(g)))
-
-        segs_per_shard = sorted(list(unique_segs_per_shard))
-        if len(segs_per_shard) == 0:
-            return ""
-        elif len(segs_per_shard) == 1:
-            return str(segs_per_shard[0])
-        else:
-            return "%d - %d" % (segs_per_shard[0], segs_per_shard[-1])
-
-    @property
-    def hot(self):
-        if not self.prev_state:
-            return "?"
-
-        if self.prev_state.docs_count != self.docs_count:
-            return "hot"
-        return ""
-
-    @property
-    def merging(self):
-        if not self.prev_state:
-            return "?"
-
-        if (self.prev_state.docs_count == self.docs_count
-                and self.prev_state.pri_store_size != self.pri_store_size):
-            return "merging"
-
-        return ""
-
-    @property
-    def replicating(self):
-        if not self.prev_state:
-            return "?"
-        if (self.prev_state.docs_count == self.docs_count
-                and self.prev_state.pri_store_size == self.pri_store_size
-                and self.prev_state.store_size != self.store_size):
-            return "rep"
-
-        return ""
-
-
-    # route other attrs through cat_indices_info
-    def __getattr__(self, attr):
-        return getattr(self.cat_indices_info, attr)
-
-    def __repr__(self):
-        return str(self.cat_indices_info)
-
-class IndicesInfo(object):
-    """ Adds cat indices plus some other stuff """
-    def __init__(self, cat_indices_response, cat_segments_response):
-        self.cat_indices_response = cat_indices_response
-        self.cat_segments_response = cat_segments_response
-        self.index_infos = [IndexInfo(i) for i in self.cat_indices_response]
-
-        # Merge in cat segments data
-        index_segments = {}
-        for k, g in itertools.groupby(self.cat_segments_response, key=lambda x:x.index):
-            index_segments[k] = list(g)
-        for i in self.index_infos:
-            if i.index in index_segments:
-                i.set_cat_segments_info(index_segments[i.index])
-
-    @property
-    def headers(self):
-        return ['health', 'status', 'index', 'pri', 'rep', 'docs_count', 'store_size', 'pri_store_size', 'age', 'segments', 'hot', 'merging']
+class IndicesFetchThread(threading.Thread):
+    """ Runs fetch_indices_info in the background and pokes the main loop through a pipe when done.
+    Each fetched IndicesInfo is also saved to state_path, if set, for the next start. Every fetch
+    is timed as a RefreshCycle in timings. """
+    def __init__(self, es, state_path=None, segments=FETCH_SEGMENTS, scope=SCOPE):
+        threading.Thread.__init__(self)
+        self.es = es
+        self.state_path = state_path
+        self.segments = segments
+        # replaced, never changed in place, so the fetch can read it without the lock
+        self.scope = list(scope)
+        self.timings = Timings()
+        self.daemon = True
+        self.notify_fd = None
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self.busy = False
+        # a follow up asked for while busy, the running fetch may have started before what prompted it
+        self.pending = False
+        self.result = None
+        self.error = None
+        self.cycle = None
+
+    def request_refresh(self, follow_up=False):
+        """ Start a fetch. Returns False if one is already running. A plain request is then served
+        by the running fetch. A follow_up one, made after something changed the cluster or what is
+        fetched, gets one more fetch after it, however many come in meanwhile. """
+        with self.lock:
+            if self.busy:
+                if follow_up:
+                    self.pending = True
+                return False
+            self.busy = True
+        self.wakeup.set()
+        return True
+
+    def take_result(self):
+        """ Called from the main loop, returns (indices_info, error, cycle) of the last finished fetch """
+        with self.lock:
+            result, error, cycle = self.result, self.error, self.cycle
+            self.result, self.error, self.cycle = None, None, None
+        return result, error, cycle
 
-    def __len__(self):
-        return len(self.index_infos)
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            result, error = None, None
+            cycle = self.timings.start_cycle()
+            try:
+                result = fetch_indices_info(self.es, cycle, self.segments, self.scope)
+            except Exception as e:
+                error = e
+            if result is not None and self.state_path:
+                try:
+                    with cycle.stage('save_state'):
+                        save_state(self.state_path, result)
+                except (IOError, OSError):
+                    # only costs the next start its warm state
+                    pass
+            self.timings.finish_cycle(cycle)
+            with self.lock:
+                self.result, self.error, self.cycle = result, error, cycle
+                if self.pending:
+                    self.pending = False
+                    self.wakeup.set()
+                else:
+                    self.busy = False
+            os.write(self.notify_fd, b"x")
+
+
+def chunk_index_names(names, max_length=MAX_MULTI_INDEX_LENGTH):
+    """ Split names into lists whose comma joined length stays under max_length """
+    chunks = []
+    chunk, length = [], 0
+    for name in names:
+        if chunk and length + 1 + len(name) > max_length:
+            chunks.append(chunk)
+            chunk, length = [], 0
+        length += len(name) + (1 if chunk else 0)
+        chunk.append(name)
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def fetch_index_column(es, column):
+    """ {index name: value of column} from cat indices """
+    return dict((row['index'], row.get(column)) for row in es.cat.indices(h='index,%s' % (column), params={'format': 'json'}))
+
+
+class BatchOperationThread(threading.Thread):
+    """ Runs an admin operation over many indices in the background
+
+    operation is called with a comma separated list of index names, one call per chunk from
+    chunk_index_names. If a chunk of several fails its indices are retried one at a time so the
+    failure is reported against the right index. verify, if given, is called with the names that succeeded
+    and returns {name: problem} for any that didn't really take effect. Operations that only take
+    one index, like create, pass a chunk_length of 0. """
+    def __init__(self, title, operation, index_names, verify=None, chunk_length=MAX_MULTI_INDEX_LENGTH):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.title = title
+        self.operation = operation
+        self.index_names = index_names
+        self.verify = verify
+        self.chunk_length = chunk_length
+        self.notify_fd = None
+        self.done = 0
+        self.finished = False
+        # name -> None if it worked, otherwise the error message
+        self.results = collections.OrderedDict((name, None) for name in index_names)
 
-    def __getitem__(self, ndx):
-        return self.index_infos[ndx]
+    def run(self):
+        for chunk in chunk_index_names(self.index_names, self.chunk_length):
+            try:
+                self.operation(",".join(chunk))
+            except Exception as e:
+                if len(chunk) == 1:
+                    # already pinned on its index, a retry would send a create or delete twice
+                    self.results[chunk[0]] = str(e)
+                else:
+                    self.retry_singly(chunk)
+            self.done += len(chunk)
+            os.write(self.notify_fd, b"p")
+
+        if self.verify is not None:
+            try:
+                succeeded = [name for name, error in self.results.items() if error is None]
+                for name, problem in self.verify(succeeded).items():
+                    self.results[name] = problem
+            except Exception as e:
+                for name in self.results:
+                    if self.results[name] is None:
+                        self.results[name] = "could not verify: %s" % (e)
+
+        self.finished = True
+        os.write(self.notify_fd, b"d")
+
+    def retry_singly(self, chunk):
+        for name in chunk:
+            try:
+                self.operation(name)
+            except Exception as e:
+                self.results[name] = str(e)
+
+    def progress(self):
+        return "%s %d/%d" % (self.title, self.done, len(self.index_names))
+
+    def report(self):
+        failed = [(name, error) for name, error in self.results.items() if error is not None]
+        lines = ["%s: %d of %d indices ok, %d failed" % (self.title, len(self.results) - len(failed), len(self.results), len(failed)), ""]
+        for name, error in failed:
+            lines.append("FAILED  %s : %s" % (name, error))
+        for name, error in self.results.items():
+            if error is None:
+                lines.append("ok      %s" % (name))
+        return lines
 
 
 class IndicesListWidget(urwid.WidgetWrap):
     """ This widget displays the Elasticsearch Cat Indices result in a sorted way """
-    def __init__(self, main, es, prev_state=None):
+    def __init__(self, main, es, indices_info, scope=SCOPE):
         self.es = es
         self.main = main
-        self.indices_info = IndicesInfo(CatIndicesResponse(self.es.cat.indices(bytes='b')), CatSegmentsResponse(self.es.cat.segments()))
+        self.indices_info = indices_info
         self.filter_text = ""
-
-        if prev_state:
-            cur_state = {}
-            for i in self.indices_info:
-                cur_state[i.index] = i
-            for i in prev_state.indices_info:
-                if i.index in cur_state:
-                    cur_state[i.index].set_prev_state(i)
-
-        self.multilistbox = MultiSelectListWidget(self.indices_info)
+        self.scope = list(scope)
+        self.show_trend = SHOW_TREND
+        self.snapshots = SnapshotStore()
+        self.snapshots.record(indices_info)
+        self.render_cycle = None
+        self.optimize_states = {}
+        self.optimize_summary = ""
+        self.details = DetailCache()
+        # families of indices rolled up into one row each (f), and the ones opened up
+        self.rolled_up = False
+        self.expanded = set()
+        self.rollup = None
+
+        self.multilistbox = MultiSelectListWidget(self.list_data())
         super(IndicesListWidget, self).__init__(self.multilistbox)
 
+    def update(self, indices_info, cycle=None):
+        """ Refresh in place with a newly fetched IndicesInfo. If given, cycle gets the time spent
+        here and in the next render. """
+        started = time.time()
+        self.snapshots.record(indices_info)
+        indices_info.show_trend = self.show_trend
+        indices_info.set_optimize_states(self.optimize_states)
+
+        self.indices_info = indices_info
+        self.multilistbox.update(self.list_data())
+        self.show_info()
+        if cycle is not None:
+            cycle.stages['update'] = time.time() - started
+            self.render_cycle = cycle
+
+    def render(self, size, focus=False):
+        cycle, self.render_cycle = self.render_cycle, None
+        if cycle is None:
+            return super(IndicesListWidget, self).render(size, focus)
+        with cycle.stage('render'):
+            canvas = super(IndicesListWidget, self).render(size, focus)
+        debug("refresh %s" % (cycle.as_dict()))
+        return canvas
+
     def keypress(self, size, key):
         if key == 'D':
             self.delete_selected_indices()
@@ -346,109 +744,313 @@ class IndicesListWidget(urwid.WidgetWrap):
             self.optimize_selected_indices()
         elif key == 'R':
             self.replicate_selected_indices()
+        elif key == 'X':
+            self.cancel_selected_optimizes()
+        elif key == 'enter':
+            if self.group_under_cursor() is not None:
+                self.toggle_group()
+            else:
+                self.show_detail()
+        elif key == 'f':
+            self.rolled_up = not self.rolled_up
+            self.multilistbox.update(self.list_data())
+            self.show_info()
+        elif key == 't':
+            self.show_trend = not self.show_trend
+            self.indices_info.show_trend = self.show_trend
+            self.multilistbox.update(self.list_data())
         elif key == ' ':
             self.main.refresh()
         elif key == '/':
-            pass
+            self.filter()
+        elif key == 'S':
+            self.change_scope()
+        elif key == 's':
+            self.change_sort()
+        elif key == 'r':
+            self.reverse_sort()
+        elif key == 'T':
+            self.change_top_n()
         else:
             return super(IndicesListWidget, self).keypress(size, key)
 
+    def list_data(self):
+        """ What the list shows, indices_info or, rolled up, its families """
+        if not self.rolled_up:
+            self.rollup = None
+            return self.indices_info
+        self.rollup = IndicesRollup(self.indices_info, self.expanded)
+        return self.rollup
+
+    def group_under_cursor(self):
+        if self.rollup is None:
+            return None
+        return self.rollup.groups.get(self.multilistbox.focus_key())
+
+    def toggle_group(self):
+        """ Open or close the group under the cursor, its member rows are only built when open """
+        group = self.group_under_cursor()
+        if group.index in self.expanded:
+            self.expanded.discard(group.index)
+        else:
+            self.expanded.add(group.index)
+        self.multilistbox.update(self.list_data())
+
     def selected(self):
-        return self.multilistbox.selected()
+        """ Selected IndexInfos in list order, a selected group stands for all of its members """
+        if self.rollup is None:
+            return [self.indices_info.get(name) for name in self.multilistbox.selected()]
+        selected = []
+        seen = set()
+        for name in self.multilistbox.selected():
+            for index_info in self.rollup.members(name):
+                if index_info.index not in seen:
+                    seen.add(index_info.index)
+                    selected.append(index_info)
+        return selected
+
+    def num_selected(self):
+        if self.rollup is None:
+            return len(self.multilistbox.selection)
+        return len(self.selected())
 
     def filter(self):
-        self.main.popup(SingleTextInputPopup("Enter filter text (python compatible regex)", 'Regex : ', self.filter_text, self.filter_answer))
+        self.main.popup(SingleTextInputPopup("Enter filter text (python compatible regex)", 'Regex : ', self.filter_text, self.filter_answer, self.filter_changed))
+
+    def filter_changed(self, filter_text):
+        # filter as the user types, a regex that doesn't compile yet keeps the last one that did
+        try:
+            self.multilistbox.filter(filter_text)
+        except re.error:
+            pass
+        self.show_info()
 
     def filter_answer(self, cancel, filter_text):
+        if cancel:
+            # back to the filter from before the popup
+            self.multilistbox.filter(self.filter_text)
+        else:
+            self.filter_changed(filter_text)
+            self.filter_text = self.multilistbox.filter_text
+        self.show_info()
+
+    def change_scope(self):
+        self.main.popup(SingleTextInputPopup("Fetch only indices matching these patterns, comma separated, -pattern excludes, empty for all",
+                                             'Scope : ', ",".join(self.scope), self.scope_answer))
+
+    def scope_answer(self, cancel, scope_text):
+        if cancel:
+            return
+        self.scope = parse_scope(scope_text)
+        # the regex filter stays on and applies to what the new scope fetches
+        self.main.set_scope(self.scope)
+        self.show_info()
+
+    def change_sort(self):
+        box = self.multilistbox
+        current = "" if box.sort_header is None else ("-" if box.sort_reverse else "") + box.sort_header
+        self.main.popup(SingleTextInputPopup("Sort by column (or the start of its name), -column for largest first, empty for index order",
+                                             'Sort by : ', current, self.sort_answer))
+
+    def sort_answer(self, cancel, sort_text):
+        if cancel:
+            return
+        sort_text = sort_text.strip()
+        reverse = sort_text.startswith("-")
+        name = sort_text.lstrip("-")
+        header = None
+        if name:
+            headers = self.multilistbox.headers
+            candidates = [h for h in headers if h == name] or [h for h in headers if h.startswith(name)]
+            if len(candidates) != 1:
+                self.main.status_line.set_status("no single column starting with %s" % (name))
+                return
+            header = candidates[0]
+        self.multilistbox.sort(header, reverse, self.multilistbox.top_n)
+        self.show_info()
+
+    def reverse_sort(self):
+        box = self.multilistbox
+        if box.sort_header is not None:
+            box.sort(box.sort_header, not box.sort_reverse, box.top_n)
+            self.show_info()
+
+    def change_top_n(self):
+        top_n = self.multilistbox.top_n
+        self.main.popup(SingleTextInputPopup("Show only the first N rows of the sort order (largest %s if unsorted), empty for all" % (TOP_N_SORT),
+                                             'N : ', str(top_n or TOP_N), self.top_n_answer))
+
+    def top_n_answer(self, cancel, top_n_text):
         if cancel:
             return
-        self.multilistbox.filter(filter_text)
+        box = self.multilistbox
+        top_n = None
+        if top_n_text.strip():
+            try:
+                top_n = max(1, int(top_n_text))
+            except ValueError:
+                self.main.status_line.set_status("not a number: %s" % (top_n_text))
+                return
+        if box.sort_header is None and top_n is not None:
+            box.sort(TOP_N_SORT, True, top_n)
+        else:
+            box.sort(box.sort_header, box.sort_reverse, top_n)
+        self.show_info()
+
+    def show_info(self):
+        info = []
+        box = self.multilistbox
+        if self.scope:
+            info.append("scope %s" % (",".join(self.scope)))
+        if self.rollup is not None:
+            info.append("%d families" % (len(self.rollup.groups)))
+        if box.filter_text != "":
+            info.append("filter /%s/ %d of %d" % (box.filter_text, len(box.matched), len(box.keys)))
+        if box.sort_header is not None:
+            order = "%s %s" % (box.sort_header, "desc" if box.sort_reverse else "asc")
+            if box.top_n is not None:
+                info.append("top %d by %s" % (box.top_n, order))
+            else:
+                info.append("sorted by %s" % (order))
+        if self.optimize_summary:
+            info.append(self.optimize_summary)
+        self.main.status_line.set_info(" -- ".join(info))
+
+    def show_optimize_states(self, states, summary):
+        """ Show where the optimize scheduler is at, in the optimize column and the status line """
+        self.optimize_states = states
+        self.optimize_summary = summary
+        self.indices_info.set_optimize_states(states)
+        self.multilistbox.update(self.list_data())
+        self.show_info()
 
     def delete_selected_indices(self):
-        self.main.popup_yes_no("Delete %d indices?" % (len(self.selected())), self.delete_selected_indices_answer)
+        self.main.popup_yes_no("Delete %d indices?" % (self.num_selected()), self.delete_selected_indices_answer)
 
     def delete_selected_indices_answer(self, answer):
         if answer != 'y':
             return
 
-        indices = [self.indices_info[ndx] for ndx in self.selected()]
-        for i in indices:
-            self.es.indices.delete(i.index)
+        indices = [i.index for i in self.selected()]
+
+        def verify(deleted):
+            remaining = fetch_index_column(self.es, 'status')
+            return dict((name, "still exists") for name in deleted if name in remaining)
 
-        # TODO - validate they are deleted
-        self.main.refresh()
+        self.main.run_batch(BatchOperationThread("delete", lambda names: self.es.indices.delete(index=names), indices, verify))
 
     def optimize_selected_indices(self):
-        self.main.popup(SingleNumberInputPopup("Optimize %d indices" % (len(self.selected())), "Max Segments : ", 10, self.optimize_selected_indices_answer))
+        self.main.popup(SingleNumberInputPopup("Optimize %d indices" % (self.num_selected()), "Max Segments : ", 10, self.optimize_selected_indices_answer))
 
     def optimize_selected_indices_answer(self, cancel, max_num_segments):
         if cancel:
             return
 
-        indices = [self.indices_info[ndx] for ndx in self.selected()]
-        for i in indices:
-            self.es.indices.optimize(i.index, max_num_segments=max_num_segments, wait_for_merge=False)
-            # dirty trick - manually change store size so it will show up as merging on refresh
-            i.pri_store_size = "optimizing"
+        # the scheduler sends them a few at a time, see optimize.py
+        self.main.optimizer.enqueue([i.index for i in self.selected()], max_num_segments)
+        self.main.optimize_changed(None)
 
-        self.main.refresh()
+    def cancel_selected_optimizes(self):
+        self.main.optimizer.cancel([i.index for i in self.selected()])
 
     def replicate_selected_indices(self):
-        if len(self.selected()) == 0:
+        indices = self.selected()
+        if len(indices) == 0:
             return
 
-        default_reps = self.indices_info[self.selected()[0]].rep
-        self.main.popup(SingleNumberInputPopup("Change replicas on %d indices" % (len(self.selected())), 'Replicas : ', default_reps, self.replicate_selected_indices_answer))
+        default_reps = indices[0].rep
+        self.main.popup(SingleNumberInputPopup("Change replicas on %d indices" % (len(indices)), 'Replicas : ', default_reps, self.replicate_selected_indices_answer))
 
     def replicate_selected_indices_answer(self, cancel, replicas):
         if cancel:
             return
 
-        indices = [self.indices_info[ndx] for ndx in self.selected()]
-        for i in indices:
-            self.es.indices.put_settings(index=i.index, body={
+        indices = [i.index for i in self.selected()]
+
+        def replicate(names):
+            self.es.indices.put_settings(index=names, body={
                 "index": {
                     "number_of_replicas": replicas
                 }
             })
 
-        # TODO - make sure it worked
-        self.main.refresh()
+        def verify(replicated):
+            reps = fetch_index_column(self.es, 'rep')
+            return dict((name, "replicas is %s" % (reps.get(name))) for name in replicated if reps.get(name) != str(replicas))
+
+        self.main.run_batch(BatchOperationThread("replicas", replicate, indices, verify))
+
+    def show_detail(self):
+        """ Shards and segments of the index under the cursor, fetched for it alone """
+        index = self.index_under_cursor()
+        if index is None:
+            return
+        detail = self.details.get(index.index)
+        if detail is not None:
+            self.main.popup_report(detail.lines())
+            return
+
+        def fetched(detail, error):
+            if error is not None:
+                self.main.status_line.set_status("drill down failed: %s" % (error))
+                return
+            self.main.status_line.set_status("")
+            self.details.put(detail)
+            self.main.popup_report(detail.lines())
+
+        self.main.status_line.set_status("fetching shards and segments of %s..." % (index.index))
+        self.main.run_in_background(lambda: fetch_index_detail(self.es, index.index), fetched)
 
     def index_under_cursor(self):
-        return self.indices_info[self.multilistbox.item_under_cursor()]
+        """ IndexInfo of the focused row, None on a group row or if no rows are shown """
+        return self.indices_info.get(self.multilistbox.focus_key())
 
     def append_index_after_selected_index(self):
-        indices = [self.indices_info[ndx] for ndx in self.selected()]
+        indices = self.selected()
         if len(indices) != 1:
             return
 
         index = indices[0]
+        if index.time_bin is None:
+            # not time based, nothing to go on but the name
+            self.main.popup(IndexInputPopup("Create index after %s" % index.index, index.index, index.pri, index.rep, self.create_index))
+            return
 
-        # Come up with suggestion for new index name
-        # This will break for non date type indices
-        ts, msec = index.index.split(".")
-        msec = int(msec.rstrip("z"))
-        suggestion = "%s.%03dz" % (ts, msec+1)
+        self.main.popup(TimeBinsInputPopup("Create the next time bins after %s" % index.index, PRECREATE_BINS, index.pri, index.rep,
+            lambda cancel, count, primaries, replicas: self.create_time_bins(cancel, index, count, primaries, replicas)))
 
-        self.main.popup(IndexInputPopup("Create index after %s" % index.index, suggestion, index.pri, index.rep, self.create_index))
+    def create_time_bins(self, cancel, index, count, primaries, replicas):
+        """ Create the count bins after index, skipping ones that exist """
+        if cancel:
+            return
+        names = next_time_bins(self.indices_info, index, count)
+        missing = [name for name in names if self.indices_info.get(name) is None]
+        title = "create %d of the next %d bins" % (len(missing), len(names))
+        if len(missing) < len(names):
+            title += ", %d exist already" % (len(names) - len(missing))
+        self.create_indices(title, missing, primaries, replicas)
 
     def create_index(self, cancel, index, primaries, replicas):
         if cancel:
             return
-        self.es.indices.create(index=index,
-            body = {
-                "settings": {
-                    "index": {
-                        "number_of_shards": primaries,
-                        "number_of_replicas": replicas
-                    }
+        self.create_indices("create", [index], primaries, replicas)
+
+    def create_indices(self, title, names, primaries, replicas):
+        """ Create names one after the other in the background """
+        body = {
+            "settings": {
+                "index": {
+                    "number_of_shards": primaries,
+                    "number_of_replicas": replicas
                 }
             }
-        )
+        }
+
+        def verify(created):
+            pri = fetch_index_column(self.es, 'pri')
+            return dict((name, "not there after creating") for name in created if name not in pri)
 
-        self.main.refresh()
-        # TODO - make sure create actually worked
+        self.main.run_batch(BatchOperationThread(title, lambda name: self.es.indices.create(index=name, body=body), names, verify, chunk_length=0))
 
 class NumberEdit(urwid.Edit):
     def __init__(self, caption, default):
@@ -464,9 +1066,12 @@ class NumberEdit(urwid.Edit):
 class SingleTextInputPopup(urwid.WidgetWrap):
     """ Asks for a single string """
 
-    def __init__(self, title, caption, default, callback):
+    def __init__(self, title, caption, default, callback, on_change=None):
         self.callback = callback
         self.edit_box = urwid.Edit(caption=caption, edit_text=default)
+        if on_change is not None:
+            # called with the new text on every edit
+            urwid.connect_signal(self.edit_box, 'change', lambda edit, text: on_change(text))
 
         pile = urwid.Pile([
             urwid.Text(title),
@@ -547,20 +1152,23 @@ class IndexInputPopup(urwid.WidgetWrap):
         self.callback = callback
 
         self.index_name = urwid.Edit(caption   ='Index name : ', edit_text=default_index_name)
+        super(IndexInputPopup, self).__init__(self.make_frame(msg, self.index_name, default_primaries, default_replicas))
+
+    def make_frame(self, msg, first_input, default_primaries, default_replicas):
+        """ msg over first_input and the primaries and replicas inputs """
         self.primaries = NumberEdit(caption='Primaries  : ', default=default_primaries)
         self.replicas = NumberEdit(caption='Replicas   : ', default=default_replicas)
 
         pile = urwid.Pile([
             urwid.Text(msg),
             urwid.Divider('-'),
-            self.index_name,
+            first_input,
             self.primaries,
             self.replicas,
             urwid.Divider(' '),
             urwid.Text('(up/down keys to move between inputs, enter to create, esc to cancel)')
         ])
-        frame = urwid.Frame(urwid.LineBox(urwid.Filler(pile)))
-        super(IndexInputPopup, self).__init__(frame)
+        return urwid.Frame(urwid.LineBox(urwid.Filler(pile)))
 
     def show_popup(self, base, loop):
         self.base = base
@@ -585,35 +1193,121 @@ class IndexInputPopup(urwid.WidgetWrap):
         self.loop.widget = self.base
 
 
+class TimeBinsInputPopup(IndexInputPopup):
+    """ Asks how many upcoming time bins to create, and their primaries and replicas """
+    def __init__(self, msg, default_count, default_primaries, default_replicas, callback):
+        self.callback = callback
+
+        self.count = NumberEdit(caption='Bins       : ', default=default_count)
+        # the bin count takes the place of the index name input, everything else is IndexInputPopup's
+        super(IndexInputPopup, self).__init__(self.make_frame(msg, self.count, default_primaries, default_replicas))
+
+    def call_callback(self, cancel):
+        self.callback(cancel, self.count.value(), self.primaries.value(), self.replicas.value())
+
+
+class StatusLineWidget(urwid.WidgetWrap):
+    """ Divider line that can carry a short status message, e.g. while refreshing, and a
+    longer lived info message, e.g. the active filter """
+    def __init__(self):
+        self.status = ""
+        self.info = ""
+        self.textbox = urwid.Text("")
+        columns = urwid.Columns([('pack', self.textbox), urwid.Divider('-')])
+        super(StatusLineWidget, self).__init__(columns)
+
+    def set_status(self, status):
+        self.status = status
+        self.redraw()
+
+    def set_info(self, info):
+        self.info = info
+        self.redraw()
+
+    def redraw(self):
+        parts = [p for p in (self.status, self.info) if p]
+        if parts:
+            self.textbox.set_text("-- %s " % (" -- ".join(parts)))
+        else:
+            self.textbox.set_text("")
+
+
 class HealthDisplayWidget(urwid.WidgetWrap):
-    """ Display cluster health on an interval """
-    def __init__(self, health_watcher):
-        self.health_watcher = health_watcher
+    """ One line of health and index totals per cluster, plus a total line when there are several.
+    The current tab is marked with > """
+    HEADERS = ['', '', 'cluster', 'status', 'nodes', 'shards', 'relo', 'init', 'unassign', 'indices', 'docs', 'store']
+
+    def __init__(self, clusters):
+        self.clusters = clusters
+        self.current = 0
         self.textbox = urwid.Text("loading...")
-        filler = urwid.Filler(self.textbox)
+        filler = urwid.Filler(self.textbox, valign='top')
         super(HealthDisplayWidget, self).__init__(filler)
 
-    def update_health(self, health, loop):
-        self.textbox.set_text(health)
+    def height(self):
+        """ Screen rows needed """
+        return 1 + len(self.clusters) + (1 if len(self.clusters) > 1 else 0)
+
+    def set_current(self, current):
+        self.current = current
+        self.redraw()
+
+    def cluster_row(self, n, cluster):
+        marker = ">" if n == self.current else ""
+        health = cluster.health_watcher.health
+        indices, docs, store = cluster.totals()
+        if health is None:
+            return [marker, str(n + 1), cluster.name, cluster.health_watcher.error or "loading...", "", "", "", "", "", "", "", ""]
+        return [marker, str(n + 1), cluster.name, health.status, str(health.node_total), str(health.shards),
+                str(health.relo), str(health.init), str(health.unassign), str(indices), str(docs), byte_format(store).strip()]
+
+    def total_row(self):
+        healths = [c.health_watcher.health for c in self.clusters]
+        statuses = [h.status for h in healths if h is not None]
+        status = "?"
+        for worst in ('red', 'yellow', 'green'):
+            if worst in statuses:
+                status = worst
+                break
+        totals = [c.totals() for c in self.clusters]
+        def total(attr):
+            return str(sum(getattr(h, attr) or 0 for h in healths if h is not None))
+        return ["", "", "total", status, total('node_total'), total('shards'), total('relo'), total('init'), total('unassign'),
+                str(sum(t[0] for t in totals)), str(sum(t[1] for t in totals)), byte_format(sum(t[2] for t in totals)).strip()]
+
+    def redraw(self):
+        rows = [self.HEADERS] + [self.cluster_row(n, c) for n, c in enumerate(self.clusters)]
+        if len(self.clusters) > 1:
+            rows.append(self.total_row())
+        widths = [max(len(row[col]) for row in rows) for col in range(len(self.HEADERS))]
+        self.textbox.set_text("\n".join(" ".join(val.ljust(w) for val, w in zip(row, widths)).rstrip() for row in rows))
 
     def update(self, loop, user_data):
-        self.textbox.set_text(self.health_watcher.health)
+        self.redraw()
         loop.set_alarm_in(HEALTH_UPDATE_FREQ, self.update)
 
 
 class ElasticsearchHealthWatchThread(threading.Thread):
-    def __init__(self):
+    """ Polls cat health of one cluster. health is the last CatHealthResponseLine, None (with error
+    set) while the cluster can't be reached. """
+    def __init__(self, es):
         threading.Thread.__init__(self)
-        self.es = elasticsearch.Elasticsearch()
+        self.es = es
         self.daemon = True
+        self.health = None
+        self.error = None
 
     def run(self):
         while True:
-            self.health = self.es.cat.health(v=True).rstrip()
+            try:
+                self.health = fetch_cat_health(self.es)
+                self.error = None
+            except Exception as e:
+                self.health = None
+                self.error = "unreachable: %s" % (e)
             time.sleep(HEALTH_UPDATE_FREQ)
 
 
-
 class YesNoPopup(urwid.WidgetWrap):
     def __init__(self, msg, base, loop, callback):
         self.base = base
@@ -641,6 +1335,39 @@ class YesNoPopup(urwid.WidgetWrap):
     def cancel(self):
         self.loop.widget = self.base
 
+class ReportPopupWidget(urwid.WidgetWrap):
+    """ Scrollable list of result lines, closed with esc, enter or q """
+
+    def __init__(self, lines, base, loop):
+        listbox = urwid.ListBox(urwid.SimpleFocusListWalker([urwid.Text(line) for line in lines]))
+        self.base = base
+        self.overlay = urwid.Overlay(urwid.LineBox(listbox), base, 'center', ('relative', 80), 'middle', ('relative', 80))
+        self.loop = loop
+
+        super(ReportPopupWidget, self).__init__(self.overlay)
+        self.loop.widget = self
+
+    def keypress(self, size, key):
+        if key in ('esc', 'enter', 'q'):
+            self.loop.widget = self.base
+        else:
+            return super(ReportPopupWidget, self).keypress(size, key)
+
+class TimingsPopupWidget(ReportPopupWidget):
+    """ Refresh stage latencies and sizes, w calls dump and closes """
+
+    def __init__(self, timings, dump, base, loop):
+        self.dump = dump
+        lines = ["Refresh timings, w to write them to a file", ""] + timings.report()
+        super(TimingsPopupWidget, self).__init__(lines, base, loop)
+
+    def keypress(self, size, key):
+        if key == 'w':
+            self.loop.widget = self.base
+            self.dump()
+        else:
+            return super(TimingsPopupWidget, self).keypress(size, key)
+
 class HelpPopupWidget(urwid.WidgetWrap):
     """ Show help text """
 
@@ -662,6 +1389,13 @@ class HelpPopupWidget(urwid.WidgetWrap):
                                    MISC
 
     space               refresh display
+    enter               shards and segments of the index under the cursor,
+                        on a family row open/close it
+    tab, shift tab      next / previous cluster
+    1 - 9               go to cluster n
+    t                   show/hide the docs/sec trend column
+    f                   roll families of indices up into one row each
+    p                   refresh timings, w in there writes them to a file
     esc                 cancel popups
     q                   quit
 --------------------------------------------------------------------------------
@@ -669,15 +1403,23 @@ class HelpPopupWidget(urwid.WidgetWrap):
                                  SELECTING
 
     v                   mark for multi-operation
+    m                   set the start of a range
+    V                   select from the range start to the cursor
+    *                   select every row matching the filter
     c                   clear selections
-    /                   filter (not implemented)
+    /                   filter rows (python regex, applied as you type)
+    S                   fetch only indices matching patterns (-pattern excludes)
+    s                   sort by a column (-column for largest first)
+    r                   reverse the sort order
+    T                   show only the top N rows of the sort order
 --------------------------------------------------------------------------------
 
                                 OPERATIONS
 
     D                   delete selected indices
-    A                   append new index after selected index
-    O                   optimize selected indices
+    A                   create the next time bins after the selected index
+    O                   optimize selected indices (queued, a few run at a time)
+    X                   cancel queued optimizes of selected indices
     R                   change # replicas on selected indices
     C                   create index (not implemented)
 --------------------------------------------------------------------------------
@@ -698,22 +1440,165 @@ class HelpPopupWidget(urwid.WidgetWrap):
         self.loop.widget = self.base
 
 
-class MainScreenWidget(urwid.WidgetWrap):
-    def __init__(self):
-        health_updater = ElasticsearchHealthWatchThread()
-        health_updater.start()
-        self.is_popup = False
+class ClusterWidget(urwid.WidgetWrap):
+    """ Everything of one cluster: its client, fetch and health threads, status line and index list.
+    Each cluster polls on its own threads, so a slow or unreachable one doesn't hold up the others. """
+    def __init__(self, screen, name, hosts, segments=FETCH_SEGMENTS, scope=SCOPE):
+        self.screen = screen
+        self.name = name
+        self.es = elasticsearch.Elasticsearch(hosts, timeout=ES_TIMEOUT, serializer=CountingJSONSerializer())
+        self.fetcher = IndicesFetchThread(self.es, state_path(name), segments, scope)
+        self.health_watcher = ElasticsearchHealthWatchThread(self.es)
+        self.optimizer = OptimizeScheduler(self.es)
+        self.status_line = StatusLineWidget()
+
+        # show what was saved last time until the first fetch, kicked off once the main loop
+        # exists, comes back. It also gives that fetch a previous state for hot/merging.
+        indices_info = load_state(state_path(name))
+        if indices_info is None:
+            indices_info = IndicesInfo(CatIndicesResponse(""), CatSegmentsResponse(""))
+
+        self.indices_list = IndicesListWidget(self, self.es, indices_info, scope)
+        self.set_totals(indices_info)
+
+        pile = urwid.Pile([('pack', self.status_line), self.indices_list], focus_item=1)
+        super(ClusterWidget, self).__init__(pile)
+
+    def start(self, loop):
+        self.health_watcher.start()
+        self.fetcher.notify_fd = loop.watch_pipe(self.indices_fetched)
+        self.fetcher.start()
+        self.optimizer.notify_fd = loop.watch_pipe(self.optimize_changed)
+        self.optimizer.start()
+        self.refresh()
+        if INDICES_UPDATE_FREQ:
+            loop.set_alarm_in(INDICES_UPDATE_FREQ, self.update_indices)
+        if self.indices_list.indices_info.stale:
+            saved = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.indices_list.indices_info.timestamp))
+            self.status_line.set_status("stale, saved %s, refreshing..." % (saved))
+
+    def update_indices(self, loop, user_data):
+        self.refresh()
+        loop.set_alarm_in(INDICES_UPDATE_FREQ, self.update_indices)
+
+    def set_totals(self, indices_info):
+        self.indices = len(indices_info)
+        self.docs = sum(i.docs_count or 0 for i in indices_info)
+        self.store = sum(i.store_size or 0 for i in indices_info)
+
+    def totals(self):
+        """ (indices, docs, store bytes) as of the last fetch """
+        return self.indices, self.docs, self.store
 
+    def popup_yes_no(self, msg, callback):
+        self.screen.popup_yes_no(msg, callback)
 
-        self.health_display = HealthDisplayWidget(health_updater)
+    def popup(self, popup_widget):
+        self.screen.popup(popup_widget)
+
+    def popup_report(self, lines):
+        ReportPopupWidget(lines, self.screen, self.screen.loop)
+
+    def run_in_background(self, func, callback):
+        """ Call func on a thread, then callback(result, error) from the main loop """
+        outcome = {}
+        def done(data):
+            os.close(notify_fd)
+            callback(outcome.get('result'), outcome.get('error'))
+            return False
+
+        def run():
+            try:
+                outcome['result'] = func()
+            except Exception as e:
+                outcome['error'] = e
+            os.write(notify_fd, b"d")
+
+        notify_fd = self.screen.loop.watch_pipe(done)
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+    def run_batch(self, batch):
+        """ Start a BatchOperationThread, show its progress and then its report """
+        loop = self.screen.loop
+        def batch_progress(data):
+            if b"d" not in data:
+                self.status_line.set_status(batch.progress())
+                return True
+            os.close(batch.notify_fd)
+            self.status_line.set_status("")
+            self.popup_report(batch.report())
+            self.refresh(follow_up=True)
+            return False
+
+        batch.notify_fd = loop.watch_pipe(batch_progress)
+        self.status_line.set_status(batch.progress())
+        batch.start()
+
+    def refresh(self, follow_up=False):
+        # the fetch runs in the background, indices_fetched swaps in the result
+        self.fetcher.request_refresh(follow_up)
+        self.status_line.set_status("refreshing...")
+
+    def set_scope(self, scope):
+        """ Fetch only indices matching scope's patterns from now on """
+        self.fetcher.scope = list(scope)
+        self.refresh(follow_up=True)
+
+    def indices_fetched(self, data):
+        indices_info, error, cycle = self.fetcher.take_result()
+        if error is not None:
+            self.status_line.set_status("refresh failed: %s" % (error))
+        elif indices_info is not None:
+            # another fetch is on its way if something changed while this one ran
+            self.status_line.set_status("refreshing..." if self.fetcher.busy else "")
+            self.indices_list.update(indices_info, cycle)
+            self.set_totals(indices_info)
+        # keep watching the pipe
+        return True
+
+    def optimize_changed(self, data):
+        self.indices_list.show_optimize_states(self.optimizer.states(), self.optimizer.summary())
+        if data:
+            # an optimize started or finished, sizes and segment counts are moving
+            self.refresh(follow_up=True)
+        return True
+
+    def show_timings(self):
+        path = os.path.join(TIMINGS_DIR, "%s-%s.jsonl" % (re.sub(r"[^\w.-]", "_", self.name), time.strftime("%Y%m%d-%H%M%S")))
+        def dump():
+            try:
+                if not os.path.isdir(TIMINGS_DIR):
+                    os.makedirs(TIMINGS_DIR)
+                self.fetcher.timings.dump(path)
+                self.status_line.set_status("timings written to %s" % (path))
+            except (IOError, OSError) as e:
+                self.status_line.set_status("writing timings failed: %s" % (e))
+        TimingsPopupWidget(self.fetcher.timings, dump, self.screen, self.screen.loop)
 
-        self.es = elasticsearch.Elasticsearch()
+    def keypress(self, size, key):
+        if key == 'p':
+            self.show_timings()
+        else:
+            return super(ClusterWidget, self).keypress(size, key)
+
+
+class MainScreenWidget(urwid.WidgetWrap):
+    """ Health header of all clusters over the current cluster's tab """
+    def __init__(self, clusters=None, segments=FETCH_SEGMENTS, scope=SCOPE):
+        self.is_popup = False
+        self.loop = None
+
+        self.clusters = [ClusterWidget(self, name, hosts, segments, scope) for name, hosts in (clusters or CLUSTERS)]
+        self.current = 0
+        self.health_display = HealthDisplayWidget(self.clusters)
+        header_rows = self.health_display.height()
 
         self.main_pile = urwid.Pile([
-            (2, self.health_display),
-            urwid.Divider('-'),
-            (self.get_screen_rows() - 3, IndicesListWidget(self, self.es))
-        ], focus_item=2)
+            (header_rows, self.health_display),
+            (self.get_screen_rows() - header_rows, self.clusters[0]),
+        ], focus_item=1)
 
         main_filler = urwid.Filler(self.main_pile, valign='top', height='pack')
 
@@ -726,6 +1611,8 @@ class MainScreenWidget(urwid.WidgetWrap):
     def init_loop(self, loop):
         self.loop = loop
         loop.set_alarm_in(0, self.start_update_health)
+        for cluster in self.clusters:
+            cluster.start(loop)
 
     def start_update_health(self, loop, userdata):
         self.health_display.update(loop, userdata)
@@ -737,22 +1624,46 @@ class MainScreenWidget(urwid.WidgetWrap):
     def popup(self, popup_widget):
         popup_widget.show_popup(self, self.loop)
 
+    def switch_to(self, n):
+        """ Show the n'th cluster's tab """
+        n = n % len(self.clusters)
+        widget, options = self.main_pile.contents[1]
+        self.main_pile.contents[1] = (self.clusters[n], options)
+        self.main_pile.focus_position = 1
+        self.current = n
+        self.health_display.set_current(n)
+
     def keypress(self, size, key):
         if key == 'q':
             raise urwid.ExitMainLoop()
         elif key == '?':
             HelpPopupWidget(self, self.loop)
+        elif key == 'tab':
+            self.switch_to(self.current + 1)
+        elif key == 'shift tab':
+            self.switch_to(self.current - 1)
+        elif key.isdigit() and 1 <= int(key) <= len(self.clusters):
+            self.switch_to(int(key) - 1)
         else:
             return super(MainScreenWidget, self).keypress(size, key)
 
-    def refresh(self):
-        # poor man's refresh
-        self.prev_indices_list, size  = self.main_pile.contents[2]
-        self.main_pile.contents[2] =  (IndicesListWidget(self, self.es, self.prev_indices_list), size)
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="esconsole", description="Console for exploring and managing elasticsearch indices")
+    parser.add_argument('clusters', nargs='*', metavar='[name=]host:port[,host:port]',
+        help="clusters to show, one tab each, default %s" % (" ".join("%s=%s" % (name, ",".join(hosts)) for name, hosts in CLUSTERS)))
+    parser.add_argument('--no-segments', dest='segments', action='store_false', default=FETCH_SEGMENTS,
+        help="don't fetch cat segments of the whole cluster on refresh, enter still shows them per index")
+    parser.add_argument('--scope', type=parse_scope, default=SCOPE, metavar='PATTERN[,PATTERN]',
+        help="fetch only indices matching these patterns, -pattern excludes, eg 'logstash-2026.10.*,-*-test'")
+    args = parser.parse_args(argv)
+    args.clusters = [parse_cluster(spec) for spec in args.clusters] or CLUSTERS
+    return args
 
 
 if __name__ == "__main__":
-    main_screen = MainScreenWidget()
+    args = parse_args(sys.argv[1:])
+    main_screen = MainScreenWidget(args.clusters, args.segments, args.scope)
 
     loop = urwid.MainLoop(main_screen, palette=[('reversed', 'standout', '')])
 
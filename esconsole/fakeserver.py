@@ -0,0 +1,325 @@
+""" A stand in elasticsearch, serving a SyntheticCluster over http, for testing and profiling
+without a real cluster
+
+    python esconsole/fakeserver.py --port 9250 --indices 10000 --latency 0.5 --error-rate 0.05
+    esconsole fake=localhost:9250
+
+It answers what esconsole calls: cat indices/segments/shards/health (json or text, h= columns, index
+patterns), delete, optimize/forcemerge, replica settings and create. Faults can be injected:
+latency per request or per endpoint, a share of requests failing with 500, requests over a
+concurrency limit rejected with 429 like a full search/bulk queue, admin calls on chosen indices
+failing, and merges that only show up in cat segments after a while.
+"""
+import sys
+import json
+import time
+import random
+import fnmatch
+import argparse
+import threading
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs, unquote
+except ImportError:
+    # python 2
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+    from urllib import unquote
+
+try:
+    from .synthetic import SyntheticCluster, CAT_INDICES_COLUMNS, CAT_SEGMENTS_COLUMNS, CAT_SHARDS_COLUMNS, CAT_HEALTH_COLUMNS
+except (ImportError, ValueError):
+    # run as a script
+    from synthetic import SyntheticCluster, CAT_INDICES_COLUMNS, CAT_SEGMENTS_COLUMNS, CAT_SHARDS_COLUMNS, CAT_HEALTH_COLUMNS
+
+
+class FaultError(Exception):
+    """ Answer the request with this status and error body instead """
+    def __init__(self, status, error_type, reason):
+        Exception.__init__(self, reason)
+        self.status = status
+        self.error_type = error_type
+        self.reason = reason
+
+
+class Faults(object):
+    """ What goes wrong, and how slowly. Attributes can be changed while the server runs.
+
+    latency          seconds added to every request
+    endpoint_latency extra seconds per endpoint, eg {'cat_segments': 2.0}
+    error_rate       share of requests answered with a 500
+    max_concurrent   requests in flight above this are rejected with 429, None for no limit
+    fail_indices     index names whose admin calls fail with a 500
+    merge_seconds    optimize returns at once, the merge shows in cat segments this much later
+    ingest_docs      docs added to the newest index of each family on every cat indices
+    """
+    def __init__(self, latency=0.0, endpoint_latency=None, error_rate=0.0, max_concurrent=None,
+            fail_indices=None, merge_seconds=0.0, ingest_docs=0, seed=0):
+        self.latency = latency
+        self.endpoint_latency = endpoint_latency or {}
+        self.error_rate = error_rate
+        self.max_concurrent = max_concurrent
+        self.fail_indices = set(fail_indices or [])
+        self.merge_seconds = merge_seconds
+        self.ingest_docs = ingest_docs
+        self.rand = random.Random(seed)
+
+
+def match_indices(names, patterns):
+    """ Names matching a comma separated list of index patterns, with -pattern exclusions, in order """
+    if not patterns or patterns in ('_all', '*'):
+        return list(names)
+    matched = []
+    for pattern in patterns.split(","):
+        if pattern.startswith("-"):
+            matched = [name for name in matched if not fnmatch.fnmatchcase(name, pattern[1:])]
+        else:
+            matched.extend(name for name in names if fnmatch.fnmatchcase(name, pattern) and name not in matched)
+    return sorted(matched)
+
+
+class FakeCluster(object):
+    """ The SyntheticCluster plus the state the admin endpoints change, behind a lock """
+    def __init__(self, cluster, name="synthetic", faults=None):
+        self.cluster = cluster
+        self.name = name
+        self.faults = faults or Faults()
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        # index name -> (max segments, time the merge shows)
+        self.merges = {}
+        # (method, path) of every request, for tests
+        self.requests = []
+
+    def apply_merges(self):
+        now = time.time()
+        for name, (max_segments, done_at) in list(self.merges.items()):
+            if done_at <= now:
+                index = self.cluster.indices.get(name)
+                if index is not None:
+                    index.segments_per_shard = [min(n, max_segments) for n in index.segments_per_shard]
+                del self.merges[name]
+
+    def matching(self, patterns):
+        """ Indices a request path names. Like es, a missing concrete name is an error, a pattern matching nothing isn't """
+        names = match_indices(self.cluster.indices, patterns)
+        for name in (patterns or "").split(","):
+            if name and "*" not in name and not name.startswith("-") and name != '_all' and name not in self.cluster.indices:
+                raise FaultError(404, "index_not_found_exception", "no such index [%s]" % (name))
+        return names
+
+    def concrete(self, patterns):
+        """ Indices an admin call acts on """
+        names = self.matching(patterns)
+        for name in names:
+            if name in self.faults.fail_indices:
+                raise FaultError(500, "exception", "injected failure on [%s]" % (name))
+        return names
+
+    def cat(self, what, patterns, columns):
+        if what == 'indices':
+            if self.faults.ingest_docs:
+                self.cluster.ingest(self.faults.ingest_docs)
+            names = set(self.matching(patterns))
+            rows = [index.cat_indices_row() for index in self.cluster.sorted_indices() if index.name in names]
+            default_columns = CAT_INDICES_COLUMNS
+        elif what == 'segments':
+            self.apply_merges()
+            names = set(self.matching(patterns))
+            rows = [row for row in self.cluster.segment_rows() if row['index'] in names]
+            default_columns = CAT_SEGMENTS_COLUMNS
+        elif what == 'shards':
+            names = set(self.matching(patterns))
+            rows = [row for row in self.cluster.shard_rows() if row['index'] in names]
+            default_columns = CAT_SHARDS_COLUMNS
+        elif what == 'health':
+            rows = [self.cluster.cat_health_row(self.name)]
+            default_columns = CAT_HEALTH_COLUMNS
+        else:
+            raise FaultError(400, "illegal_argument_exception", "no cat %s here" % (what))
+        return rows, columns or default_columns
+
+    def delete(self, patterns):
+        for name in self.concrete(patterns):
+            del self.cluster.indices[name]
+            self.merges.pop(name, None)
+
+    def optimize(self, patterns, max_num_segments):
+        done_at = time.time() + self.faults.merge_seconds
+        for name in self.concrete(patterns):
+            self.merges[name] = (max_num_segments, done_at)
+        self.apply_merges()
+
+    def put_settings(self, patterns, settings):
+        settings = settings.get('index', settings)
+        replicas = settings.get('number_of_replicas', settings.get('index.number_of_replicas'))
+        for name in self.concrete(patterns):
+            if replicas is not None:
+                self.cluster.indices[name].rep = int(replicas)
+
+    def create(self, name, body):
+        if name in self.cluster.indices:
+            raise FaultError(400, "index_already_exists_exception", "index [%s] already exists" % (name))
+        settings = (body or {}).get('settings', {})
+        settings = settings.get('index', settings)
+        pri = int(settings.get('number_of_shards', self.cluster.shards))
+        rep = int(settings.get('number_of_replicas', self.cluster.replicas))
+        self.cluster.add_index(name, pri=pri, rep=rep)
+
+
+class FakeRequestHandler(BaseHTTPRequestHandler):
+    """ Routes requests to server.fake, a FakeCluster """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # quiet, tests and the console share the terminal
+        pass
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_HEAD(self):
+        self.handle_request('HEAD')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_PUT(self):
+        self.handle_request('PUT')
+
+    def do_DELETE(self):
+        self.handle_request('DELETE')
+
+    def handle_request(self, method):
+        fake = self.server.fake
+        url = urlparse(self.path)
+        path = [unquote(p) for p in url.path.split("/") if p]
+        params = dict((k, v[-1]) for k, v in parse_qs(url.query, keep_blank_values=True).items())
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length).decode('utf-8')) if length else None
+
+        with fake.lock:
+            fake.requests.append((method, url.path))
+            fake.in_flight += 1
+            in_flight = fake.in_flight
+        try:
+            if not path:
+                # the client checks what it is talking to, never fault this
+                return self.respond(200, {'name': 'fake', 'cluster_name': fake.name, 'tagline': "You Know, for Search",
+                    'version': {'number': '7.17.0', 'build_flavor': 'default'}})
+
+            faults = fake.faults
+            endpoint = "cat_%s" % (path[1]) if path[0] == '_cat' and len(path) > 1 else method.lower()
+            time.sleep(faults.latency + faults.endpoint_latency.get(endpoint, 0.0))
+            if faults.max_concurrent is not None and in_flight > faults.max_concurrent:
+                raise FaultError(429, "es_rejected_execution_exception", "rejected, %d requests in flight" % (in_flight))
+            if faults.error_rate and faults.rand.random() < faults.error_rate:
+                raise FaultError(500, "exception", "injected failure")
+
+            with fake.lock:
+                self.route(fake, method, path, params, body)
+        except FaultError as e:
+            self.respond(e.status, {'error': {'type': e.error_type, 'reason': e.reason}, 'status': e.status})
+        finally:
+            with fake.lock:
+                fake.in_flight -= 1
+
+    def route(self, fake, method, path, params, body):
+        if path[0] == '_cat' and len(path) > 1 and method == 'GET':
+            patterns = path[2] if len(path) > 2 else None
+            columns = params['h'].split(",") if params.get('h') else None
+            rows, columns = fake.cat(path[1], patterns, columns)
+            if params.get('format') == 'json':
+                return self.respond(200, [dict((c, row.get(c)) for c in columns) for row in rows])
+            lines = [" ".join(columns)] if params.get('v') in ('', 'true') else []
+            lines.extend(" ".join(str(row.get(c) or "") for c in columns) for row in rows)
+            return self.respond(200, "".join(line + "\n" for line in lines))
+        elif len(path) == 1 and method == 'DELETE':
+            fake.delete(path[0])
+        elif len(path) == 2 and path[1] in ('_optimize', '_forcemerge') and method == 'POST':
+            fake.optimize(path[0], int(params.get('max_num_segments', 1)))
+        elif len(path) == 2 and path[1] == '_settings' and method == 'PUT':
+            fake.put_settings(path[0], body or {})
+        elif len(path) == 1 and method == 'PUT':
+            fake.create(path[0], body)
+        elif len(path) == 1 and method == 'HEAD':
+            return self.respond(200 if path[0] in fake.cluster.indices else 404, None)
+        else:
+            raise FaultError(400, "illegal_argument_exception", "no handler for %s /%s" % (method, "/".join(path)))
+        return self.respond(200, {'acknowledged': True})
+
+    def respond(self, status, content):
+        if content is None:
+            data, content_type = b"", "application/json"
+        elif isinstance(content, str):
+            data, content_type = content.encode('utf-8'), "text/plain; charset=UTF-8"
+        else:
+            data, content_type = json.dumps(content).encode('utf-8'), "application/json; charset=UTF-8"
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('X-Elastic-Product', 'Elasticsearch')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+
+class FakeServer(ThreadingMixIn, HTTPServer):
+    """ Serves a FakeCluster on host:port, port 0 picks a free one """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, fake, host="localhost", port=0):
+        HTTPServer.__init__(self, (host, port), FakeRequestHandler)
+        self.fake = fake
+
+    @property
+    def address(self):
+        """ host:port, as given to elasticsearch.Elasticsearch([...]) """
+        return "%s:%d" % (self.server_address[0], self.server_address[1])
+
+    def start(self):
+        """ Serve on a daemon thread, shut down with shutdown() """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake elasticsearch serving synthetic cluster data")
+    parser.add_argument('--host', default="localhost")
+    parser.add_argument('--port', type=int, default=9250)
+    parser.add_argument('--name', default="synthetic", help="cluster name")
+    parser.add_argument('--indices', type=int, default=1000)
+    parser.add_argument('--max-segments', type=int, default=20, help="most segments per shard copy")
+    parser.add_argument('--closed-ratio', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument('--segments-latency', type=float, default=0.0, help="extra seconds on cat segments")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests failing with a 500")
+    parser.add_argument('--max-concurrent', type=int, default=None, help="reject requests above this many in flight with a 429")
+    parser.add_argument('--fail-indices', default="", help="comma separated indices whose admin calls fail")
+    parser.add_argument('--merge-seconds', type=float, default=0.0, help="time for an optimize to show in cat segments")
+    parser.add_argument('--ingest', type=int, default=0, help="docs added to the newest indices per cat indices")
+    args = parser.parse_args(argv)
+
+    faults = Faults(latency=args.latency, endpoint_latency={'cat_segments': args.segments_latency},
+        error_rate=args.error_rate, max_concurrent=args.max_concurrent,
+        fail_indices=[name for name in args.fail_indices.split(",") if name],
+        merge_seconds=args.merge_seconds, ingest_docs=args.ingest, seed=args.seed)
+    cluster = SyntheticCluster(args.indices, closed_ratio=args.closed_ratio, max_segments=args.max_segments, seed=args.seed)
+    server = FakeServer(FakeCluster(cluster, args.name, faults), args.host, args.port)
+    sys.stderr.write("serving %d indices on %s\n" % (len(cluster.indices), server.address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
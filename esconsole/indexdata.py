@@ -0,0 +1,962 @@
+""" Parsing and modelling of cat indices / cat segments output, no UI in here
+
+The console and the headless report both build on this, so it must not import urwid. """
+import re
+import sys
+import time
+import datetime
+import collections
+
+try:
+    from .timings import RefreshCycle, note_response_size, last_response_size
+except (ImportError, ValueError):
+    # run as a script
+    from timings import RefreshCycle, note_response_size, last_response_size
+
+# Refreshes remembered per index for hot/merging, rates and the trend sparkline
+HISTORY_SIZE=60
+# Rates are averaged over the last this many refreshes
+RATE_SAMPLES=5
+# Show the docs/sec sparkline column (toggle with t)
+SHOW_TREND=False
+# Drill down results (enter) are reused for this many seconds, for up to this many indices
+DETAIL_TTL=30
+DETAIL_CACHE_SIZE=50
+
+# elasticsearch's kb, mb, ... are 1024 of the unit before, for parsing its sizes and showing ours
+BYTE_SUFFIXES=['b', 'kb', 'mb', 'gb', 'tb', 'pb']
+BYTE_UNITS=dict((suffix, 1024 ** n) for n, suffix in enumerate(BYTE_SUFFIXES))
+
+# Time based index naming, (name prefix, strftime format of the rest of the name).
+# Used to work out index ages, indices that match none of these have an age of -1.
+INDEX_NAMING_SCHEMES=[
+    ("", "%Y-%m-%dt%H:%M:%S.%fz"),      # 2015-10-10t00:00:00.000z
+    ("logstash-", "%Y.%m.%d"),          # logstash-2015.10.10
+    ("metrics-", "%Y.%m.%d-%H"),        # metrics-2015.10.10-00
+]
+
+def rate_format(num, is_bytes=False):
+    if num is None:
+        return ""
+    sign = "-" if num < 0 else ""
+    if is_bytes:
+        return "%s%s/s" % (sign, byte_format(abs(num)).strip())
+    return "%s%.1f/s" % (sign, abs(num))
+
+def byte_format(num):
+    if num is None or num == "":
+        return ""
+    num = float(num)
+    for suffix in BYTE_SUFFIXES:
+        # 1000 to 1023 of a unit show as 1 of the next, keeping the number 5 wide
+        if num < 1000:
+            if suffix == 'b':
+                return "%6d%s" % (num, suffix)
+            formatted = "%5.1f" % (num)
+            if formatted.endswith(".0"):
+                return "  %s%s" % (formatted[:-2], suffix)
+            return "%s%s" % (formatted, suffix)
+        num = num / 1024
+
+try:
+    intern = sys.intern
+except AttributeError:
+    # python 2 has it as a builtin, bind it here so other modules can import it from us
+    intern = intern
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+def parse_bytes(val):
+    """ Parse '720', '720b' or '1.5kb' into a number of bytes """
+    num = val.rstrip('bkmgtp')
+    if num == val:
+        return int(val)
+    return int(float(num) * BYTE_UNITS[val[len(num):]])
+
+def iter_lines(text):
+    """ Yield the non blank lines of text one at a time instead of splitting it into a list """
+    start = 0
+    end = len(text)
+    while start < end:
+        nl = text.find("\n", start)
+        if nl == -1:
+            nl = end
+        line = text[start:nl]
+        start = nl + 1
+        if line.strip():
+            yield line
+
+def iter_records(record_cls, cat_result):
+    """ Turn a cat response into records. cat_result is either plain text (es 1.7 default
+    columns) or the list of dicts returned for format=json """
+    if isinstance(cat_result, string_types):
+        return (record_cls(line) for line in iter_lines(cat_result))
+    return (record_cls.from_dict(row) for row in cat_result)
+
+class CatRecord(object):
+        """ Base for the __slots__ records below. columns are the cat h= names of the slots. """
+        __slots__ = []
+        columns = []
+        converters = []
+
+        @classmethod
+        def from_dict(cls, row):
+            self = cls.__new__(cls)
+            for h, c, conv in zip(cls.__slots__, cls.columns, cls.converters):
+                val = row.get(c)
+                if val is None or val == "":
+                    setattr(self, h, None)
+                else:
+                    setattr(self, h, conv(val))
+            return self
+
+        def __repr__(self):
+            return " ".join(str(getattr(self, h)) for h in self.__slots__ if getattr(self, h) is not None)
+
+class CatIndicesResponseLine(CatRecord):
+        # es 1.7 headers
+        # example lines
+        # green  open   2015-10-10t00:00:00.000z   5   0          0            0       720b           720b
+        #        close  2015-08-11t00:00:00.000z
+        __slots__ = ['health', 'status', 'index', 'pri', 'rep', 'docs_count', 'docs_deleted', 'store_size', 'pri_store_size']
+        columns = ['health', 'status', 'index', 'pri', 'rep', 'docs.count', 'docs.deleted', 'store.size', 'pri.store.size']
+        converters = [intern, intern, intern, int, int, int, int, parse_bytes, parse_bytes]
+
+        def __init__(self, line):
+            fields = line.split()
+            if len(fields) != 9:
+                for h in self.__slots__:
+                    setattr(self, h, None)
+                if len(fields) == 2:
+                    self.status, self.index = intern(fields[0]), intern(fields[1])
+                else:
+                    for h, conv, f in zip(self.__slots__, self.converters, fields):
+                        setattr(self, h, conv(f))
+            else:
+                self.health = intern(fields[0])
+                self.status = intern(fields[1])
+                self.index = intern(fields[2])
+                self.pri = int(fields[3])
+                self.rep = int(fields[4])
+                self.docs_count = int(fields[5])
+                self.docs_deleted = int(fields[6])
+                self.store_size = parse_bytes(fields[7])
+                self.pri_store_size = parse_bytes(fields[8])
+
+class CatIndicesResponse(object):
+    """ Wrap Cat Indices Responses """
+    def __init__(self, cat_indices_result):
+        self.headers = ['health', 'status', 'index', 'pri', 'rep', 'docs_count', 'docs_deleted', 'store_size', 'pri_store_size']
+        self.indices = sorted(iter_records(CatIndicesResponseLine, cat_indices_result), key=lambda x: x.index)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, ndx):
+        return self.indices[ndx]
+
+class IndexSegmentStats(object):
+    """ Committed primary segment stats of one index, reduced from cat segments rows as they are parsed """
+    __slots__ = ['shard_segments', 'size_memory', 'docs_deleted', 'min_segments', 'max_segments']
+
+    def __init__(self):
+        self.shard_segments = {}
+        self.size_memory = 0
+        self.docs_deleted = 0
+        self.min_segments = None
+        self.max_segments = None
+
+    def add(self, segment):
+        self.shard_segments[segment.shard] = self.shard_segments.get(segment.shard, 0) + 1
+        self.size_memory += segment.size_memory or 0
+        self.docs_deleted += segment.docs_deleted or 0
+
+    def finish(self):
+        if self.shard_segments:
+            self.min_segments = min(self.shard_segments.values())
+            self.max_segments = max(self.shard_segments.values())
+
+    def __str__(self):
+        if self.min_segments is None:
+            return ""
+        elif self.min_segments == self.max_segments:
+            return str(self.min_segments)
+        return "%d - %d" % (self.min_segments, self.max_segments)
+
+class CatSegmentsResponse(object):
+    """ Wrap Cat Segments Responses
+
+    Rows are reduced into per index IndexSegmentStats while parsing and then dropped, so memory is
+    O(indices x shards) instead of O(segments). Rows don't need to arrive grouped. """
+    def __init__(self, cat_segments_result):
+        self.headers = ['index', 'shard', 'prirep', 'committed', 'size_memory', 'docs_deleted']
+        self.index_stats = {}
+        self.rows = 0
+
+        for segment in iter_records(CatSegmentsResponseLine, cat_segments_result):
+            self.rows += 1
+            if segment.prirep != 'p' or segment.committed != 'true':
+                continue
+            stats = self.index_stats.get(segment.index)
+            if stats is None:
+                stats = self.index_stats[segment.index] = IndexSegmentStats()
+            stats.add(segment)
+
+        for stats in self.index_stats.values():
+            stats.finish()
+
+    def get(self, index):
+        return self.index_stats.get(index)
+
+    def __len__(self):
+        return len(self.index_stats)
+
+class CatSegmentsResponseLine(CatRecord):
+        # Only the columns the segment stats need are kept, they are asked for with h=columns.
+        # Plain text lines come in that order as well, eg
+        # 2015-10-05t00:00:00.000z 0 p true 3298 0
+        #
+        # There can be millions of these, so no per instance __dict__ and repeated strings are interned
+        __slots__ = ['index', 'shard', 'prirep', 'committed', 'size_memory', 'docs_deleted']
+        columns = ['index', 'shard', 'prirep', 'committed', 'size.memory', 'docs.deleted']
+        converters = [intern, int, intern, intern, parse_bytes, int]
+
+        def __init__(self, line):
+            fields = line.split()
+            for h, conv, f in zip(self.__slots__, self.converters, fields):
+                setattr(self, h, conv(f))
+            for h in self.__slots__[len(fields):]:
+                setattr(self, h, None)
+
+
+class CatHealthResponseLine(CatRecord):
+        # es 1.7 cat health, without the leading epoch/timestamp columns
+        # example line
+        # elasticsearch green           3         3     35  15    0    0        0
+        __slots__ = ['cluster', 'status', 'node_total', 'node_data', 'shards', 'pri', 'relo', 'init', 'unassign']
+        columns = ['cluster', 'status', 'node.total', 'node.data', 'shards', 'pri', 'relo', 'init', 'unassign']
+        converters = [str, intern, int, int, int, int, int, int, int]
+
+        def __init__(self, line):
+            for h in self.__slots__:
+                setattr(self, h, None)
+            for h, conv, f in zip(self.__slots__, self.converters, line.split()):
+                setattr(self, h, conv(f))
+
+
+class CatShardsResponseLine(CatRecord):
+        # from json only, unassigned shards have no docs, store, ip or node
+        __slots__ = ['index', 'shard', 'prirep', 'state', 'docs', 'store', 'ip', 'node']
+        columns = ['index', 'shard', 'prirep', 'state', 'docs', 'store', 'ip', 'node']
+        converters = [intern, int, intern, intern, int, parse_bytes, intern, intern]
+
+class CatSegmentDetailLine(CatRecord):
+        # every segment of one index for the drill down, from json only
+        __slots__ = ['index', 'shard', 'prirep', 'ip', 'segment', 'docs_count', 'docs_deleted', 'size', 'size_memory', 'committed', 'searchable']
+        columns = ['index', 'shard', 'prirep', 'ip', 'segment', 'docs.count', 'docs.deleted', 'size', 'size.memory', 'committed', 'searchable']
+        converters = [intern, int, intern, intern, str, int, int, parse_bytes, parse_bytes, intern, intern]
+
+
+def parse_cluster(spec):
+    """ [name=]host:port[,host:port...] to (name, hosts), the name defaults to the hosts """
+    name, sep, hosts = spec.rpartition("=")
+    return (name or hosts, hosts.split(","))
+
+def parse_scope(text):
+    """ Index patterns from a comma or space separated list, eg "logstash-2026.10.*,-*-test" """
+    return [pattern for pattern in re.split(r"[,\s]+", text or "") if pattern]
+
+def scope_index(scope):
+    """ The index parameter fetching only the indices in scope, None for all of them. Elasticsearch
+    applies -pattern exclusions to what the patterns before them matched, so a scope of exclusions
+    only starts from * """
+    if not scope:
+        return None
+    if all(pattern.startswith("-") for pattern in scope):
+        scope = ["*"] + list(scope)
+    return ",".join(scope)
+
+def fetch_cat_indices(es, cycle=None, scope=None):
+    """ Fetch only the columns we use, as json so empty columns and column order can't confuse the parser """
+    cycle = cycle or RefreshCycle()
+    note_response_size(None)
+    with cycle.stage('cat_indices_http'):
+        result = es.cat.indices(index=scope_index(scope), bytes='b', h=",".join(CatIndicesResponseLine.columns), params={'format': 'json'})
+    cycle.count('cat_indices_bytes', last_response_size())
+    with cycle.stage('cat_indices_parse'):
+        response = CatIndicesResponse(result)
+    cycle.count('cat_indices_rows', len(response))
+    return response
+
+def fetch_cat_segments(es, cycle=None, scope=None):
+    cycle = cycle or RefreshCycle()
+    note_response_size(None)
+    with cycle.stage('cat_segments_http'):
+        result = es.cat.segments(index=scope_index(scope), bytes='b', h=",".join(CatSegmentsResponseLine.columns), params={'format': 'json'})
+    cycle.count('cat_segments_bytes', last_response_size())
+    with cycle.stage('cat_segments_parse'):
+        response = CatSegmentsResponse(result)
+    cycle.count('cat_segments_rows', response.rows)
+    return response
+
+def fetch_cat_health(es):
+    for health in iter_records(CatHealthResponseLine, es.cat.health(h=",".join(CatHealthResponseLine.columns), params={'format': 'json'})):
+        return health
+
+CAT_INDICES_FIELDS = frozenset(CatIndicesResponseLine.__slots__)
+
+IndexTimestamp = collections.namedtuple('IndexTimestamp', ['prefix', 'format', 'timestamp'])
+
+class IndexNamingSchemes(object):
+    """ Works out which time bin an index name is for
+
+    Schemes are looked up by name prefix, longest prefix first, so each name only gets
+    strptime'd against the formats registered for its prefix. Results are cached by name
+    since the same indices come back on every refresh. """
+    MAX_CACHED_NAMES = 100000
+
+    def __init__(self, schemes):
+        self.by_prefix = {}
+        self.prefix_lengths = []
+        self.cache = {}
+        for prefix, fmt in schemes:
+            self.add(prefix, fmt)
+
+    def add(self, prefix, fmt):
+        self.by_prefix.setdefault(prefix, []).append(fmt)
+        self.prefix_lengths = sorted(set(len(p) for p in self.by_prefix), reverse=True)
+        self.cache.clear()
+
+    def remove(self, prefix, fmt):
+        """ Undo add(prefix, fmt) """
+        self.by_prefix[prefix].remove(fmt)
+        if not self.by_prefix[prefix]:
+            del self.by_prefix[prefix]
+        self.prefix_lengths = sorted(set(len(p) for p in self.by_prefix), reverse=True)
+        self.cache.clear()
+
+    def parse(self, name):
+        """ IndexTimestamp for name, or None if no scheme matches """
+        if name in self.cache:
+            return self.cache[name]
+
+        result = None
+        for length in self.prefix_lengths:
+            prefix = name[:length]
+            for fmt in self.by_prefix.get(prefix, []):
+                try:
+                    result = IndexTimestamp(prefix, fmt, datetime.datetime.strptime(name[length:], fmt))
+                    break
+                except ValueError:
+                    pass
+            if result is not None:
+                break
+
+        if len(self.cache) >= self.MAX_CACHED_NAMES:
+            self.cache.clear()
+        self.cache[name] = result
+        return result
+
+index_naming = IndexNamingSchemes(INDEX_NAMING_SCHEMES)
+
+def add_months(timestamp, months):
+    month = timestamp.month - 1 + months
+    return timestamp.replace(year=timestamp.year + month // 12, month=month % 12 + 1, day=1)
+
+def bin_step(fmt, timestamps):
+    """ Time between bins of a family, the most common gap between its timestamps. Monthly
+    families (%m but no %d) are returned as an int number of months, others as a timedelta. """
+    if "%m" in fmt and "%d" not in fmt:
+        return 1
+    gaps = collections.Counter(b - a for a, b in zip(timestamps, timestamps[1:]) if b > a)
+    if gaps:
+        return gaps.most_common(1)[0][0]
+    # a family of one, go by the finest field of the format, metrics-%Y.%m.%d-%H is hourly even at hour 00
+    fields = (("%S", datetime.timedelta(seconds=1)), ("%M", datetime.timedelta(minutes=1)), ("%H", datetime.timedelta(hours=1)))
+    if all(field in fmt for field, step in fields):
+        # a full timestamp like 2015-10-10t00:00:00.000z says nothing of the bin size, only the
+        # finest field that isn't zero does
+        last = timestamps[-1]
+        values = {"%S": last.second, "%M": last.minute, "%H": last.hour}
+        fields = [(field, step) for field, step in fields if values[field]]
+    for field, step in fields:
+        if field in fmt:
+            return step
+    return datetime.timedelta(days=1)
+
+def format_bin(prefix, fmt, timestamp, like):
+    """ Index name of a time bin, with as many %f digits as the existing name like has """
+    name = prefix + timestamp.strftime(fmt)
+    if "%f" in fmt and len(name) > len(like):
+        digits = max(0, 6 - (len(name) - len(like)))
+        name = prefix + timestamp.strftime(fmt.replace("%f", timestamp.strftime("%f")[:digits]))
+    return name
+
+def next_time_bins(indices_info, index_info, count):
+    """ Names of the count time bins after index_info, or [] if it isn't time based. The gap
+    between bins comes from its family (same prefix and format) in indices_info. Names that
+    already exist are included. """
+    time_bin = index_info.time_bin
+    if time_bin is None:
+        return []
+    family = sorted((i.time_bin.timestamp, i.index) for i in indices_info
+        if i.time_bin is not None and i.time_bin.prefix == time_bin.prefix and i.time_bin.format == time_bin.format)
+    step = bin_step(time_bin.format, [ts for ts, name in family])
+
+    names = []
+    for n in range(1, count + 1):
+        if isinstance(step, int):
+            timestamp = add_months(time_bin.timestamp, step * n)
+        else:
+            timestamp = time_bin.timestamp + step * n
+        names.append(format_bin(time_bin.prefix, time_bin.format, timestamp, index_info.index))
+    return names
+
+SPARK_CHARS = u"\u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588"
+
+# What is remembered of an index per refresh
+IndexSample = collections.namedtuple('IndexSample', ['timestamp', 'docs_count', 'pri_store_size', 'store_size'])
+
+class IndexHistory(object):
+    """ Ring buffer of the last HISTORY_SIZE IndexSamples of an index """
+    __slots__ = ['samples']
+
+    def __init__(self):
+        self.samples = collections.deque(maxlen=HISTORY_SIZE)
+
+    def add(self, timestamp, index_info):
+        if index_info.docs_count is None:
+            # closed
+            return
+        if self.samples and self.samples[-1][0] >= timestamp:
+            return
+        self.samples.append(IndexSample(timestamp, index_info.docs_count, index_info.pri_store_size, index_info.store_size))
+
+    def previous(self):
+        """ The sample before the latest one, None if there isn't one yet """
+        if len(self.samples) < 2:
+            return None
+        return self.samples[-2]
+
+    def rate(self, field):
+        """ Change per second of field (1 = docs_count, 2 = pri_store_size) over the last RATE_SAMPLES samples """
+        if len(self.samples) < 2:
+            return None
+        first = self.samples[max(0, len(self.samples) - RATE_SAMPLES - 1)]
+        last = self.samples[-1]
+        return float(last[field] - first[field]) / (last[0] - first[0])
+
+    def docs_rate(self):
+        return self.rate(1)
+
+    def bytes_rate(self):
+        return self.rate(2)
+
+    def merge_rate(self):
+        """ Bytes/sec the primaries shrank by while no docs came in, over the last RATE_SAMPLES samples """
+        if len(self.samples) < 2:
+            return None
+        samples = list(self.samples)[-RATE_SAMPLES - 1:]
+        shrunk = 0
+        for prev, cur in zip(samples, samples[1:]):
+            if prev[1] == cur[1] and cur[2] < prev[2]:
+                shrunk += prev[2] - cur[2]
+        return float(shrunk) / (samples[-1][0] - samples[0][0])
+
+    def sparkline(self):
+        """ docs/sec between each pair of samples, scaled to block characters """
+        rates = []
+        for prev, cur in zip(list(self.samples), list(self.samples)[1:]):
+            rates.append(max(0.0, float(cur[1] - prev[1]) / (cur[0] - prev[0])))
+        top = max(rates) if rates else 0
+        if top == 0:
+            return SPARK_CHARS[0] * len(rates)
+        return u"".join(SPARK_CHARS[int(r / top * (len(SPARK_CHARS) - 1))] for r in rates)
+
+class SnapshotStore(object):
+    """ The last HISTORY_SIZE refreshes, kept as an IndexHistory of compact IndexSamples per index
+
+    This is all that's kept of previous refreshes. IndexInfo.prev_state is the previous IndexSample,
+    not the previous IndexInfo, so old IndicesInfos (and their segment stats) can be freed. Indices
+    missing from a refresh are evicted, so memory is bounded by indices x HISTORY_SIZE however long
+    the console runs. """
+    def __init__(self):
+        self.indices = {}
+        self.timestamps = collections.deque(maxlen=HISTORY_SIZE)
+
+    def record(self, indices_info):
+        """ Add a snapshot and hook each IndexInfo up to its history and previous state """
+        self.timestamps.append(indices_info.timestamp)
+        seen = set()
+        for i in indices_info:
+            seen.add(i.index)
+            if i.docs_count is None:
+                # closed, nothing to compare with and a reopened index starts over
+                self.indices.pop(i.index, None)
+                i.set_history(None)
+                i.set_prev_state(None)
+                continue
+            history = self.indices.get(i.index)
+            if history is None:
+                history = self.indices[i.index] = IndexHistory()
+            history.add(indices_info.timestamp, i)
+            i.set_history(history)
+            i.set_prev_state(history.previous())
+        self.evict([name for name in self.indices if name not in seen])
+
+    def evict(self, names):
+        for name in names:
+            self.indices.pop(name, None)
+
+    def clear(self):
+        self.indices.clear()
+        self.timestamps.clear()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+def format_column(attr, val):
+    # format field names
+    if attr in ('pri_store_size', 'store_size'):
+        return byte_format(val)
+    elif attr in ('bytes_rate', 'merge_rate'):
+        return rate_format(val, is_bytes=True)
+    elif attr == 'docs_rate':
+        return rate_format(val)
+    return val
+
+class IndexInfo(object):
+    """ Wraps CatIndicesResponseLine and provides additional info """
+    def __init__(self, cat_indices_info, now=None):
+        self.cat_indices_info = cat_indices_info
+        self.segment_stats = None
+        self.prev_state = None
+        self.history = None
+        # queued/merging/... while the optimize scheduler has it
+        self.optimize = ""
+
+        # parse the time bin out of the name once, age is in days against now
+        self.time_bin = index_naming.parse(cat_indices_info.index)
+        self.set_now(now or datetime.datetime.now())
+
+    def set_now(self, now):
+        if self.time_bin is None:
+            self.age = -1
+        else:
+            self.age = (now - self.time_bin.timestamp).days
+
+    def set_segment_stats(self, segment_stats):
+        self.segment_stats = segment_stats
+
+    def set_prev_state(self, prev_state):
+        self.prev_state = prev_state
+
+    def set_history(self, history):
+        self.history = history
+
+    def values(self, attrs):
+        # cat columns straight from the record, __getattr__ is slow for this many calls
+        record = self.cat_indices_info
+        return tuple(getattr(record, attr) if attr in CAT_INDICES_FIELDS else getattr(self, attr) for attr in attrs)
+
+    def format(self, attr):
+        return self.format_value(attr, getattr(self, attr))
+
+    def format_value(self, attr, val):
+        return format_column(attr, val)
+
+    def sort_value(self, attr, val):
+        """ What val of attr sorts by, typed so numbers don't sort as text. None sorts last. """
+        if attr == 'segments':
+            return self.segment_stats.max_segments if self.segment_stats is not None else None
+        elif attr == 'age':
+            return None if val < 0 else val
+        elif attr == 'trend':
+            return self.docs_rate
+        elif attr in ('hot', 'merging'):
+            # counted, so it sorts along with the counts of groups
+            return 1 if val in ('hot', 'merging') else None
+        elif val == "":
+            return None
+        return val
+
+    @property
+    def docs_rate(self):
+        if self.history is None:
+            return None
+        return self.history.docs_rate()
+
+    @property
+    def bytes_rate(self):
+        if self.history is None:
+            return None
+        return self.history.bytes_rate()
+
+    @property
+    def merge_rate(self):
+        if self.history is None:
+            return None
+        return self.history.merge_rate()
+
+    @property
+    def trend(self):
+        if self.history is None:
+            return ""
+        return self.history.sparkline()
+
+    @property
+    def segments(self):
+        if self.segment_stats is None:
+            return ""
+        return str(self.segment_stats)
+
+    @property
+    def hot(self):
+        if not self.prev_state:
+            return "?"
+
+        if self.prev_state.docs_count != self.docs_count:
+            return "hot"
+        return ""
+
+    @property
+    def merging(self):
+        if not self.prev_state:
+            return "?"
+
+        if (self.prev_state.docs_count == self.docs_count
+                and self.prev_state.pri_store_size != self.pri_store_size):
+            return "merging"
+
+        return ""
+
+    @property
+    def replicating(self):
+        if not self.prev_state:
+            return "?"
+        if (self.prev_state.docs_count == self.docs_count
+                and self.prev_state.pri_store_size == self.pri_store_size
+                and self.prev_state.store_size != self.store_size):
+            return "rep"
+
+        return ""
+
+
+    # route other attrs through cat_indices_info
+    def __getattr__(self, attr):
+        return getattr(self.cat_indices_info, attr)
+
+    def __repr__(self):
+        return str(self.cat_indices_info)
+
+class IndicesInfo(object):
+    """ Adds cat indices plus some other stuff """
+    def __init__(self, cat_indices_response, cat_segments_response):
+        self.cat_indices_response = cat_indices_response
+        self.cat_segments_response = cat_segments_response
+        self.show_trend = SHOW_TREND
+        # loaded from disk rather than fetched, see statefile
+        self.stale = False
+        self.optimize_states = {}
+
+        # one now for all ages in this snapshot, timestamp for rates
+        self.timestamp = time.time()
+        self.now = datetime.datetime.now()
+        self.index_infos = [IndexInfo(i, self.now) for i in self.cat_indices_response]
+        self.by_name = dict((i.index, i) for i in self.index_infos)
+
+        # Merge in cat segments data
+        for i in self.index_infos:
+            i.set_segment_stats(self.cat_segments_response.get(i.index))
+
+    @property
+    def headers(self):
+        headers = ['health', 'status', 'index', 'pri', 'rep', 'docs_count', 'store_size', 'pri_store_size', 'age', 'segments', 'hot', 'merging', 'docs_rate', 'bytes_rate', 'merge_rate']
+        if self.optimize_states:
+            headers.insert(headers.index('merging') + 1, 'optimize')
+        if self.show_trend:
+            headers.append('trend')
+        return headers
+
+    def set_optimize_states(self, states):
+        """ {index: optimize scheduler state}, the optimize column is shown while there are any """
+        for name in self.optimize_states:
+            if name in self.by_name:
+                self.by_name[name].optimize = ""
+        for name, state in states.items():
+            if name in self.by_name:
+                self.by_name[name].optimize = state
+        self.optimize_states = states
+
+    def key(self, index_info):
+        return index_info.index
+
+    def get(self, name):
+        return self.by_name.get(name)
+
+    def __len__(self):
+        return len(self.index_infos)
+
+    def __getitem__(self, ndx):
+        return self.index_infos[ndx]
+
+
+# Worst first, a group is as healthy as its worst index
+HEALTH_ORDER = ['red', 'yellow', 'green']
+
+# Trailing number of rollover style names, eg logs-000042
+FAMILY_NUMBER = re.compile(r"\d+$")
+
+def index_family(index_info):
+    """ Name pattern of the family of an index, eg logstash-* for logstash-2026.10.18 and logs-* for
+    logs-000042. None if it isn't part of one. """
+    if index_info.time_bin is not None:
+        return index_info.time_bin.prefix + "*"
+    match = FAMILY_NUMBER.search(index_info.index)
+    if match is not None and match.start() > 0:
+        return index_info.index[:match.start()] + "*"
+    return None
+
+class IndexGroup(object):
+    """ Totals of the indices of one family, a row of the rolled up list """
+    def __init__(self, index):
+        # the family pattern, unlike index names it can't clash with one
+        self.index = index
+        self.members = []
+        self.expanded = False
+        self.health = None
+        self.statuses = set()
+        self.pri = 0
+        self.docs_count = 0
+        self.store_size = 0
+        self.pri_store_size = 0
+        self.ages = []
+        self.max_segments = None
+        self.hot = 0
+        self.merging = 0
+        self.docs_rate = None
+        self.bytes_rate = None
+        self.merge_rate = None
+        self.fields = {}
+
+    def add(self, index_info):
+        self.members.append(index_info)
+        health = index_info.health
+        if health in HEALTH_ORDER and (self.health is None or HEALTH_ORDER.index(health) < HEALTH_ORDER.index(self.health)):
+            self.health = health
+        self.statuses.add(index_info.status)
+        self.pri += index_info.pri or 0
+        self.docs_count += index_info.docs_count or 0
+        self.store_size += index_info.store_size or 0
+        self.pri_store_size += index_info.pri_store_size or 0
+        if index_info.age >= 0:
+            self.ages.append(index_info.age)
+        segments = index_info.segment_stats.max_segments if index_info.segment_stats is not None else None
+        if segments is not None and (self.max_segments is None or segments > self.max_segments):
+            self.max_segments = segments
+        self.hot += index_info.hot == "hot"
+        self.merging += index_info.merging == "merging"
+        for rate in ('docs_rate', 'bytes_rate', 'merge_rate'):
+            value = getattr(index_info, rate)
+            if value is not None:
+                setattr(self, rate, (getattr(self, rate) or 0) + value)
+
+    def finish(self, expanded):
+        """ Called once every member is added, works out what the row shows """
+        self.expanded = expanded
+        self.fields = {
+            'health': self.health,
+            'status': list(self.statuses)[0] if len(self.statuses) == 1 else "mixed",
+            'index': "%s %s (%d)" % ("-" if expanded else "+", self.index, len(self.members)),
+            'pri': self.pri,
+            'docs_count': self.docs_count,
+            'store_size': self.store_size,
+            'pri_store_size': self.pri_store_size,
+            'age': (min(self.ages), max(self.ages)) if self.ages else None,
+            'segments': "" if self.max_segments is None else str(self.max_segments),
+            'hot': "%d hot" % (self.hot) if self.hot else "",
+            'merging': "%d merging" % (self.merging) if self.merging else "",
+            'docs_rate': self.docs_rate,
+            'bytes_rate': self.bytes_rate,
+            'merge_rate': self.merge_rate,
+        }
+
+    def values(self, attrs):
+        return tuple(self.fields.get(attr, "") for attr in attrs)
+
+    def format_value(self, attr, val):
+        if attr == 'age':
+            if val is None:
+                return ""
+            return str(val[0]) if val[0] == val[1] else "%d-%d" % val
+        return format_column(attr, val)
+
+    def sort_value(self, attr, val):
+        if attr == 'index':
+            return self.index
+        elif attr == 'age':
+            return None if val is None else val[0]
+        elif attr == 'segments':
+            return self.max_segments
+        elif attr in ('hot', 'merging'):
+            return getattr(self, attr)
+        elif val == "":
+            return None
+        return val
+
+class IndexGroupMember(object):
+    """ An index shown under its expanded group """
+    __slots__ = ['index_info']
+
+    def __init__(self, index_info):
+        self.index_info = index_info
+
+    @property
+    def index(self):
+        return self.index_info.index
+
+    def values(self, attrs):
+        values = self.index_info.values(attrs)
+        return tuple("    " + val if attr == 'index' else val for attr, val in zip(attrs, values))
+
+    def format_value(self, attr, val):
+        return self.index_info.format_value(attr, val)
+
+    def sort_value(self, attr, val):
+        return self.index_info.sort_value(attr, val)
+
+class IndicesRollup(object):
+    """ IndicesInfo with every family of indices rolled up into one IndexGroup row, in one pass over
+    it. Only members of expanded groups get rows, after their group. A family of one stays a plain
+    index row. """
+    def __init__(self, indices_info, expanded=()):
+        self.indices_info = indices_info
+        families = {}
+        order = []
+        for index_info in indices_info:
+            family = index_family(index_info)
+            if family is None:
+                order.append(index_info)
+                continue
+            group = families.get(family)
+            if group is None:
+                group = families[family] = IndexGroup(family)
+                order.append(group)
+            group.add(index_info)
+
+        self.groups = {}
+        # member index -> its group, expanded or not
+        self.parents = {}
+        self.rows = []
+        for row in order:
+            if not isinstance(row, IndexGroup):
+                self.rows.append(row)
+            elif len(row.members) == 1:
+                self.rows.append(row.members[0])
+            else:
+                row.finish(row.index in expanded)
+                self.groups[row.index] = row
+                self.rows.append(row)
+                for member in row.members:
+                    self.parents[member.index] = row.index
+                if row.expanded:
+                    self.rows.extend(IndexGroupMember(member) for member in row.members)
+
+    @property
+    def headers(self):
+        return self.indices_info.headers
+
+    def key(self, row):
+        return row.index
+
+    def get(self, name):
+        return self.groups.get(name) or self.indices_info.get(name)
+
+    def members(self, name):
+        """ IndexInfos a row stands for, all members for a group """
+        if name in self.groups:
+            return self.groups[name].members
+        index_info = self.indices_info.get(name)
+        return [] if index_info is None else [index_info]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, ndx):
+        return self.rows[ndx]
+
+
+def fetch_indices_info(es, cycle=None, segments=True, scope=None):
+    """ Fetch and parse cat indices + cat segments. Blocks, so keep it off the UI thread.
+    segments=False skips the cluster wide cat segments, the segments column is left empty.
+    scope, a list of index patterns, fetches only the indices matching them. """
+    cycle = cycle or RefreshCycle()
+    indices = fetch_cat_indices(es, cycle, scope)
+    if segments:
+        segments = fetch_cat_segments(es, cycle, scope)
+    else:
+        segments = CatSegmentsResponse([])
+    with cycle.stage('merge'):
+        return IndicesInfo(indices, segments)
+
+
+class IndexDetail(object):
+    """ Shards and segments of one index, for the drill down """
+    def __init__(self, index, shards, segments):
+        self.index = index
+        self.shards = sorted(shards, key=lambda s: (s.shard, s.prirep, s.node or ""))
+        self.segments = list(segments)
+        self.fetched = time.time()
+
+    def copy_stats(self):
+        """ [(shard, prirep, ip, segments, docs, deleted, size, memory)] per shard copy """
+        stats = collections.OrderedDict()
+        for seg in sorted(self.segments, key=lambda s: (s.shard, s.prirep, s.ip or "")):
+            key = (seg.shard, seg.prirep, seg.ip)
+            count, docs, deleted, size, memory = stats.get(key, (0, 0, 0, 0, 0))
+            stats[key] = (count + 1, docs + (seg.docs_count or 0), deleted + (seg.docs_deleted or 0), size + (seg.size or 0), memory + (seg.size_memory or 0))
+        return [key + values for key, values in stats.items()]
+
+    def lines(self):
+        fetched = time.strftime("%H:%M:%S", time.localtime(self.fetched))
+        lines = ["%s, fetched %s" % (self.index, fetched), "",
+                 "%5s %-3s %-12s %12s %10s  %s" % ("shard", "", "state", "docs", "store", "node")]
+        for s in self.shards:
+            lines.append("%5d %-3s %-12s %12s %10s  %s" % (s.shard, s.prirep, s.state, "" if s.docs is None else s.docs,
+                byte_format(s.store) if s.store is not None else "", s.node or ""))
+        lines.extend(["", "%5s %-3s %-15s %8s %12s %10s %10s %10s" % ("shard", "", "ip", "segments", "docs", "deleted", "size", "memory")])
+        for shard, prirep, ip, count, docs, deleted, size, memory in self.copy_stats():
+            lines.append("%5d %-3s %-15s %8d %12d %10d %10s %10s" % (shard, prirep, ip or "", count, docs, deleted, byte_format(size), byte_format(memory)))
+        return lines
+
+def fetch_index_detail(es, index):
+    shards = iter_records(CatShardsResponseLine, es.cat.shards(index=index, bytes='b', h=",".join(CatShardsResponseLine.columns), params={'format': 'json'}))
+    segments = iter_records(CatSegmentDetailLine, es.cat.segments(index=index, bytes='b', h=",".join(CatSegmentDetailLine.columns), params={'format': 'json'}))
+    return IndexDetail(index, shards, segments)
+
+
+class DetailCache(object):
+    """ IndexDetails by index name, dropped after ttl seconds, least recently used first past size """
+    def __init__(self, ttl=DETAIL_TTL, size=DETAIL_CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self.details = collections.OrderedDict()
+
+    def get(self, index):
+        detail = self.details.pop(index, None)
+        if detail is None or time.time() - detail.fetched > self.ttl:
+            return None
+        self.details[index] = detail
+        return detail
+
+    def put(self, detail):
+        self.details.pop(detail.index, None)
+        self.details[detail.index] = detail
+        while len(self.details) > self.size:
+            self.details.popitem(last=False)
+
+    def __len__(self):
+        return len(self.details)
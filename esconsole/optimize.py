@@ -0,0 +1,255 @@
+""" Queues optimize (force merge) requests and runs a few at a time
+
+Merging is heavy on disk, so instead of sending every optimize at once they are queued and started
+while fewer than MAX_MERGES run on the cluster and fewer than MAX_MERGES_PER_NODE on every node
+holding a copy of the index. An optimize is done when cat segments shows no shard copy of the
+index with more than max_num_segments segments. """
+import os
+import time
+import threading
+import collections
+
+import elasticsearch
+
+# Optimizes running at once per cluster
+MAX_MERGES=2
+# Optimizes running at once on any one node
+MAX_MERGES_PER_NODE=1
+# Check cat segments of the running optimizes every this many seconds
+MERGE_POLL_FREQ=10
+# Finished optimizes are still shown for this many seconds
+MERGE_DONE_SHOWN=60
+
+
+class OptimizeJob(object):
+    __slots__ = ['index', 'max_num_segments', 'state', 'nodes', 'segments', 'error', 'changed']
+
+    def __init__(self, index, max_num_segments):
+        self.index = index
+        self.max_num_segments = max_num_segments
+        # queued, merging, done or failed
+        self.state = 'queued'
+        self.nodes = None
+        # most segments on a shard copy, last seen
+        self.segments = None
+        self.error = None
+        self.changed = time.time()
+
+    def set_state(self, state, error=None):
+        self.state = state
+        self.error = error
+        self.changed = time.time()
+
+    def describe(self, queue_position=None):
+        """ Short text for the list """
+        if self.state == 'queued':
+            return "queued %d" % (queue_position)
+        elif self.state == 'merging':
+            if self.segments is None:
+                return "merging"
+            return "merging %d>%d" % (self.segments, self.max_num_segments)
+        elif self.state == 'failed':
+            return "failed: %s" % (self.error)
+        return self.state
+
+
+def request_optimize(es, index, max_num_segments):
+    if hasattr(es.indices, 'forcemerge'):
+        # newer clients and clusters, blocks until the merge is done
+        es.indices.forcemerge(index=index, max_num_segments=max_num_segments)
+    else:
+        es.indices.optimize(index=index, max_num_segments=max_num_segments, wait_for_merge=False)
+
+def fetch_shard_nodes(es, names):
+    """ {index: set of nodes holding a copy} """
+    nodes = dict((name, set()) for name in names)
+    for row in es.cat.shards(index=",".join(names), h='index,node', params={'format': 'json'}):
+        if row.get('node') and row['index'] in nodes:
+            nodes[row['index']].add(row['node'])
+    return nodes
+
+def fetch_max_segments(es, names):
+    """ {index: most segments on any one shard copy}, indices without segments left out """
+    counts = collections.Counter()
+    for row in es.cat.segments(index=",".join(names), h='index,shard,prirep,ip', params={'format': 'json'}):
+        counts[(row['index'], row['shard'], row['prirep'], row['ip'])] += 1
+    segments = {}
+    for (index, shard, prirep, ip), count in counts.items():
+        segments[index] = max(count, segments.get(index, 0))
+    return segments
+
+
+class OptimizeScheduler(threading.Thread):
+    """ Runs queued optimizes of one cluster, MAX_MERGES at a time and MAX_MERGES_PER_NODE per node.
+    Writes to notify_fd, if set, whenever a job changes state. """
+    def __init__(self, es, max_merges=MAX_MERGES, max_merges_per_node=MAX_MERGES_PER_NODE):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.es = es
+        self.max_merges = max_merges
+        self.max_merges_per_node = max_merges_per_node
+        self.notify_fd = None
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        # index name -> OptimizeJob, in the order they were queued
+        self.jobs = collections.OrderedDict()
+
+    def enqueue(self, names, max_num_segments):
+        """ Queue optimizes, an index already queued or merging keeps its place """
+        with self.lock:
+            for name in names:
+                job = self.jobs.get(name)
+                if job is None or job.state in ('done', 'failed'):
+                    self.jobs.pop(name, None)
+                    self.jobs[name] = OptimizeJob(name, max_num_segments)
+        self.wakeup.set()
+
+    def cancel(self, names):
+        """ Drop queued optimizes, ones already merging can't be stopped """
+        with self.lock:
+            for name in names:
+                if name in self.jobs and self.jobs[name].state == 'queued':
+                    del self.jobs[name]
+        self.notify()
+
+    def states(self):
+        """ {index: short state text} of the jobs worth showing """
+        states = {}
+        position = 0
+        with self.lock:
+            for name, job in self.jobs.items():
+                if job.state == 'queued':
+                    position += 1
+                states[name] = job.describe(position)
+        return states
+
+    def summary(self):
+        with self.lock:
+            counts = collections.Counter(job.state for job in self.jobs.values())
+        if not counts:
+            return ""
+        return "optimize: %d merging, %d queued, %d done, %d failed" % (
+            counts['merging'], counts['queued'], counts['done'], counts['failed'])
+
+    def notify(self):
+        if self.notify_fd is not None:
+            os.write(self.notify_fd, b"m")
+
+    def send(self, job):
+        """ Sends the optimize, on its own thread as newer clusters only answer when the merge is done """
+        try:
+            request_optimize(self.es, job.index, job.max_num_segments)
+        except elasticsearch.ConnectionTimeout:
+            # still merging most likely, cat segments will tell
+            pass
+        except Exception as e:
+            with self.lock:
+                job.set_state('failed', e)
+            self.notify()
+            self.wakeup.set()
+
+    def start_jobs(self):
+        """ Start queued jobs while the caps allow, in queue order but skipping ones whose nodes are busy.
+        Returns (started, failed) jobs. """
+        with self.lock:
+            queued = [job for job in self.jobs.values() if job.state == 'queued']
+            merging = [job for job in self.jobs.values() if job.state == 'merging']
+        if not queued or len(merging) >= self.max_merges:
+            return [], []
+
+        failed = []
+        unknown = [job for job in queued if job.nodes is None]
+        if unknown:
+            try:
+                nodes = fetch_shard_nodes(self.es, [job.index for job in unknown])
+            except elasticsearch.NotFoundError:
+                # an index went away, find out which
+                nodes = {}
+                for job in unknown:
+                    try:
+                        nodes.update(fetch_shard_nodes(self.es, [job.index]))
+                    except elasticsearch.NotFoundError:
+                        with self.lock:
+                            job.set_state('failed', "index is gone")
+                        failed.append(job)
+            for job in unknown:
+                job.nodes = nodes.get(job.index, set())
+
+        busy = collections.Counter(node for job in merging for node in job.nodes)
+        started = []
+        with self.lock:
+            for job in queued:
+                if len(merging) + len(started) >= self.max_merges:
+                    break
+                # cancelled while the nodes were fetched
+                if self.jobs.get(job.index) is not job:
+                    continue
+                if job.state != 'queued' or any(busy[node] >= self.max_merges_per_node for node in job.nodes):
+                    continue
+                job.set_state('merging')
+                busy.update(job.nodes)
+                started.append(job)
+        for job in started:
+            sender = threading.Thread(target=self.send, args=(job,))
+            sender.daemon = True
+            sender.start()
+        return started, failed
+
+    def check_jobs(self):
+        """ Mark merging jobs done whose indices are down to max_num_segments. Returns (finished, failed) jobs. """
+        with self.lock:
+            merging = [job for job in self.jobs.values() if job.state == 'merging']
+        if not merging:
+            return [], []
+        failed = []
+        try:
+            segments = fetch_max_segments(self.es, [job.index for job in merging])
+        except elasticsearch.NotFoundError:
+            # an index went away, find out which
+            segments = {}
+            for job in merging:
+                try:
+                    segments.update(fetch_max_segments(self.es, [job.index]))
+                except elasticsearch.NotFoundError:
+                    with self.lock:
+                        job.set_state('failed', "index is gone")
+                    failed.append(job)
+        finished = []
+        with self.lock:
+            for job in merging:
+                if job.state != 'merging':
+                    continue
+                job.segments = segments.get(job.index, 0)
+                if job.segments <= job.max_num_segments:
+                    job.set_state('done')
+                    finished.append(job)
+        return finished, failed
+
+    def forget_done(self):
+        """ Drop jobs done more than MERGE_DONE_SHOWN seconds ago, returns their names """
+        cutoff = time.time() - MERGE_DONE_SHOWN
+        with self.lock:
+            forgotten = [name for name, job in self.jobs.items() if job.state == 'done' and job.changed < cutoff]
+            for name in forgotten:
+                del self.jobs[name]
+        return forgotten
+
+    def step(self):
+        """ One round of checking and starting jobs, the thread does one every MERGE_POLL_FREQ
+        seconds or when woken """
+        finished, failed = self.check_jobs()
+        started, not_started = self.start_jobs()
+        forgotten = self.forget_done()
+        if finished or failed or started or not_started or forgotten:
+            self.notify()
+        return finished, started
+
+    def run(self):
+        while True:
+            self.wakeup.wait(MERGE_POLL_FREQ)
+            self.wakeup.clear()
+            try:
+                self.step()
+            except Exception:
+                # the cluster didn't answer, try again next round
+                pass
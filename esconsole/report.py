@@ -0,0 +1,114 @@
+""" Headless report: fetch once and write the computed index rows to stdout
+
+    esconsole --report [[name=]host:port[,host:port]] --format json|csv|table [--fields index,age,...] [--no-segments] [--scope PATTERN,...]
+
+json is one object per line so it can be streamed and piped into other tools, values are raw
+(bytes, days). table is what the console shows. This doesn't import urwid, so it starts quickly
+and works without a terminal, eg from cron.
+"""
+import time
+
+# as close to process start as we can measure from in here
+STARTED = time.time()
+
+import sys
+import csv
+import json
+import argparse
+
+try:
+    from .indexdata import CatIndicesResponseLine, fetch_indices_info, parse_scope, parse_cluster
+except (ImportError, ValueError):
+    # run as a script
+    from indexdata import CatIndicesResponseLine, fetch_indices_info, parse_scope, parse_cluster
+
+FIELDS = CatIndicesResponseLine.__slots__ + ['age', 'segments']
+DEFAULT_FIELDS = ['index', 'health', 'status', 'pri', 'rep', 'docs_count', 'docs_deleted', 'store_size', 'pri_store_size', 'age', 'segments']
+
+
+class FirstByteTimer(object):
+    """ Wraps an output file and notes when the first byte went out """
+    def __init__(self, out):
+        self.out = out
+        self.first_byte = None
+
+    def write(self, data):
+        if self.first_byte is None:
+            self.first_byte = time.time()
+        self.out.write(data)
+
+    def flush(self):
+        self.out.flush()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="esconsole --report", description="Write index info to stdout instead of running the console")
+    parser.add_argument('--report', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('cluster', nargs='?', type=parse_cluster, default=parse_cluster("localhost:9200"),
+        metavar='[name=]host:port[,host:port]', help="cluster to report on, default localhost:9200")
+    parser.add_argument('--format', choices=['json', 'csv', 'table'], default='table')
+    parser.add_argument('--fields', default=",".join(DEFAULT_FIELDS), help="comma separated, default %(default)s")
+    parser.add_argument('--no-segments', action='store_true', help="skip cat segments, the segments field will be empty")
+    parser.add_argument('--scope', type=parse_scope, default=[], metavar='PATTERN[,PATTERN]', help="only indices matching these patterns, -pattern excludes")
+    parser.add_argument('--timings', action='store_true', help="print where the time to first output went on stderr")
+    args = parser.parse_args(argv)
+    unknown = [f for f in args.fields.split(",") if f not in FIELDS]
+    if unknown:
+        parser.error("unknown fields %s, choose from %s" % (",".join(unknown), ",".join(FIELDS)))
+    return args
+
+
+def write_json(indices_info, fields, out):
+    for i in indices_info:
+        out.write(json.dumps(dict(zip(fields, i.values(fields))), sort_keys=True))
+        out.write("\n")
+
+
+def write_csv(indices_info, fields, out):
+    writer = csv.writer(out)
+    writer.writerow(fields)
+    for i in indices_info:
+        writer.writerow(["" if v is None else v for v in i.values(fields)])
+
+
+def write_table(indices_info, fields, out):
+    # needs every row to size the columns, so this one doesn't stream
+    rows = [[str(i.format_value(f, v)) for f, v in zip(fields, i.values(fields))] for i in indices_info]
+    widths = [max([len(f)] + [len(row[n]) for row in rows]) for n, f in enumerate(fields)]
+    out.write("   ".join(f.ljust(w) for f, w in zip(fields, widths)).rstrip() + "\n")
+    for row in rows:
+        out.write("   ".join(val.ljust(w) for val, w in zip(row, widths)).rstrip() + "\n")
+
+WRITERS = {
+    'json': write_json,
+    'csv': write_csv,
+    'table': write_table,
+}
+
+
+def main(argv=None, out=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    out = FirstByteTimer(out or sys.stdout)
+    fields = args.fields.split(",")
+
+    import elasticsearch
+    name, hosts = args.cluster
+    es = elasticsearch.Elasticsearch(hosts)
+    imported = time.time()
+
+    indices_info = fetch_indices_info(es, segments=not args.no_segments, scope=args.scope)
+    fetched = time.time()
+
+    WRITERS[args.format](indices_info, fields, out)
+    out.flush()
+    done = time.time()
+
+    if args.timings:
+        first_byte = out.first_byte or done
+        sys.stderr.write("first byte after %.0fms (imports %.0fms, fetch+parse %.0fms), done after %.0fms, %d indices\n" % (
+            (first_byte - STARTED) * 1000, (imported - STARTED) * 1000, (fetched - imported) * 1000, (done - STARTED) * 1000, len(indices_info)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+""" Keeps the last IndicesInfo of each cluster on disk, so a restart has something to show while the
+first fetch runs, and something to compare that fetch against for hot/merging/rates.
+
+The file is columnar: a fixed header, then one block per column. Strings are a newline joined
+utf-8 block, numbers a packed array of doubles (nan for missing, exact up to 2**53). Loading is
+one read plus an array.frombytes per column, no per row parsing and no pickle. """
+import os
+import re
+import sys
+import math
+import time
+import array
+import struct
+
+try:
+    from .indexdata import CatIndicesResponseLine, CatIndicesResponse, CatSegmentsResponse, IndexSegmentStats, IndicesInfo, intern
+except (ImportError, ValueError):
+    # run as a script
+    from indexdata import CatIndicesResponseLine, CatIndicesResponse, CatSegmentsResponse, IndexSegmentStats, IndicesInfo, intern
+
+# Where the per cluster state files go
+STATE_DIR=os.path.expanduser("~/.esconsole/state")
+# Saved state older than this many seconds is ignored on start
+STATE_MAX_AGE=24 * 60 * 60
+
+MAGIC = b"ESCSTATE"
+VERSION = 1
+# magic, version, timestamp of the fetch, number of rows
+HEADER = struct.Struct("<8sHdI")
+BLOCK_LENGTH = struct.Struct("<I")
+
+STRING_COLUMNS = ['health', 'status', 'index']
+NUMBER_COLUMNS = ['pri', 'rep', 'docs_count', 'docs_deleted', 'store_size', 'pri_store_size']
+SEGMENT_COLUMNS = ['min_segments', 'max_segments', 'size_memory', 'docs_deleted']
+
+NAN = float('nan')
+
+
+def state_path(cluster, state_dir=None):
+    """ State file of a cluster, eg localhost:9200 """
+    return os.path.join(state_dir or STATE_DIR, re.sub(r"[^\w.-]", "_", cluster) + ".state")
+
+def pack_numbers(values):
+    numbers = array.array('d', [NAN if v is None else v for v in values])
+    if sys.byteorder == 'big':
+        numbers.byteswap()
+    return numbers.tobytes() if hasattr(numbers, 'tobytes') else numbers.tostring()
+
+def unpack_numbers(data):
+    numbers = array.array('d')
+    if hasattr(numbers, 'frombytes'):
+        numbers.frombytes(data)
+    else:
+        numbers.fromstring(data)
+    if sys.byteorder == 'big':
+        numbers.byteswap()
+    return [None if math.isnan(v) else int(v) for v in numbers]
+
+def pack_strings(values):
+    return u"\n".join(v or u"" for v in values).encode('utf-8')
+
+def unpack_strings(data):
+    values = data.decode('utf-8').split(u"\n")
+    if str is bytes:
+        # python 2, keep them as str like the cat parsers do
+        values = [v.encode('utf-8') for v in values]
+    return [intern(v) if v else None for v in values]
+
+
+def save_state(path, indices_info):
+    """ Write indices_info to path, through a temp file so a reader never sees half a file """
+    records = [i.cat_indices_info for i in indices_info]
+    stats = [i.segment_stats or IndexSegmentStats() for i in indices_info]
+
+    blocks = [pack_strings([getattr(r, c) for r in records]) for c in STRING_COLUMNS]
+    blocks.extend(pack_numbers([getattr(r, c) for r in records]) for c in NUMBER_COLUMNS)
+    blocks.extend(pack_numbers([getattr(s, c) for s in stats]) for c in SEGMENT_COLUMNS)
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "wb") as fh:
+        fh.write(HEADER.pack(MAGIC, VERSION, indices_info.timestamp, len(records)))
+        for block in blocks:
+            fh.write(BLOCK_LENGTH.pack(len(block)))
+            fh.write(block)
+    if hasattr(os, 'replace'):
+        os.replace(tmp_path, path)
+    else:
+        os.rename(tmp_path, path)
+
+def load_state(path, max_age=STATE_MAX_AGE):
+    """ The IndicesInfo saved at path, marked stale. None if there is none, it is older than
+    max_age seconds or it can't be read. """
+    try:
+        with open(path, "rb") as fh:
+            data = fh.read()
+        magic, version, timestamp, rows = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION or time.time() - timestamp > max_age:
+            return None
+
+        blocks = []
+        offset = HEADER.size
+        for n in range(len(STRING_COLUMNS) + len(NUMBER_COLUMNS) + len(SEGMENT_COLUMNS)):
+            length, = BLOCK_LENGTH.unpack_from(data, offset)
+            offset += BLOCK_LENGTH.size
+            blocks.append(data[offset:offset + length])
+            offset += length
+
+        columns = [unpack_strings(b) for b in blocks[:len(STRING_COLUMNS)]]
+        columns.extend(unpack_numbers(b) for b in blocks[len(STRING_COLUMNS):])
+    except (IOError, OSError, ValueError, struct.error):
+        # missing, truncated or garbled, start cold
+        return None
+
+    if rows == 0:
+        columns = [[] for c in columns]
+    if any(len(c) != rows for c in columns):
+        return None
+
+    cat_indices = CatIndicesResponse([])
+    cat_segments = CatSegmentsResponse([])
+    record_columns = STRING_COLUMNS + NUMBER_COLUMNS
+    for row in zip(*columns):
+        record = CatIndicesResponseLine.__new__(CatIndicesResponseLine)
+        for h, val in zip(record_columns, row):
+            setattr(record, h, val)
+        cat_indices.indices.append(record)
+
+        segment_values = row[len(record_columns):]
+        if segment_values[0] is not None:
+            stats = IndexSegmentStats()
+            for h, val in zip(SEGMENT_COLUMNS, segment_values):
+                setattr(stats, h, val)
+            cat_segments.index_stats[record.index] = stats
+
+    indices_info = IndicesInfo(cat_indices, cat_segments)
+    indices_info.timestamp = timestamp
+    indices_info.stale = True
+    return indices_info
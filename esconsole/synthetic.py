@@ -0,0 +1,163 @@
+""" Made up but realistic looking cluster data, for benchmarks and testing without a real cluster """
+import random
+import datetime
+
+# (prefix, strftime format, time between indices) of the time based families generated
+FAMILIES = [
+    ("", "%Y-%m-%dt%H:%M:%S.000z", datetime.timedelta(days=1)),
+    ("logstash-", "%Y.%m.%d", datetime.timedelta(days=1)),
+    ("metrics-", "%Y.%m.%d-%H", datetime.timedelta(hours=1)),
+]
+
+CAT_INDICES_COLUMNS = ['health', 'status', 'index', 'pri', 'rep', 'docs.count', 'docs.deleted', 'store.size', 'pri.store.size']
+CAT_HEALTH_COLUMNS = ['cluster', 'status', 'node.total', 'node.data', 'shards', 'pri', 'relo', 'init', 'unassign']
+CAT_SHARDS_COLUMNS = ['index', 'shard', 'prirep', 'state', 'docs', 'store', 'ip', 'node']
+CAT_SEGMENTS_COLUMNS = ['index', 'shard', 'prirep', 'ip', 'segment', 'generation', 'docs.count', 'docs.deleted', 'size', 'size.memory', 'committed', 'searchable', 'version', 'compound']
+
+class SyntheticIndex(object):
+    __slots__ = ['name', 'status', 'health', 'pri', 'rep', 'docs_count', 'docs_deleted', 'pri_store_size', 'segments_per_shard']
+
+    def __init__(self, name, status, health, pri, rep, docs_count, docs_deleted, pri_store_size, segments_per_shard):
+        self.name = name
+        self.status = status
+        self.health = health
+        self.pri = pri
+        self.rep = rep
+        self.docs_count = docs_count
+        self.docs_deleted = docs_deleted
+        self.pri_store_size = pri_store_size
+        self.segments_per_shard = segments_per_shard
+
+    @property
+    def store_size(self):
+        return self.pri_store_size * (1 + self.rep)
+
+    def cat_indices_row(self):
+        """ A cat indices format=json row, closed indices only have status and index like the real thing """
+        if self.status == 'close':
+            return {'health': None, 'status': 'close', 'index': self.name, 'pri': None, 'rep': None,
+                    'docs.count': None, 'docs.deleted': None, 'store.size': None, 'pri.store.size': None}
+        return {'health': self.health, 'status': self.status, 'index': self.name, 'pri': str(self.pri),
+                'rep': str(self.rep), 'docs.count': str(self.docs_count), 'docs.deleted': str(self.docs_deleted),
+                'store.size': str(self.store_size), 'pri.store.size': str(self.pri_store_size)}
+
+
+class SyntheticCluster(object):
+    """ A reproducible made up cluster
+
+    num_indices indices spread over the FAMILIES plus some non time based ones, closed_ratio of them
+    closed. Each open shard copy has between 1 and max_segments segments, so cat segments has about
+    num_indices x shards x (1 + replicas) x max_segments / 2 rows. """
+    def __init__(self, num_indices=1000, closed_ratio=0.05, shards=5, replicas=1, max_segments=20, nodes=6, seed=0):
+        self.rand = random.Random(seed)
+        self.shards = shards
+        self.replicas = replicas
+        self.max_segments = max_segments
+        self.ips = ["10.0.0.%d" % (n + 1) for n in range(nodes)]
+        self.indices = {}
+
+        end = datetime.datetime(2026, 10, 18)
+        per_family = num_indices // (len(FAMILIES) + 1)
+        names = []
+        for prefix, fmt, step in FAMILIES:
+            names.extend(prefix + (end - step * n).strftime(fmt) for n in range(per_family))
+        names.extend("app-%05d" % (n) for n in range(num_indices - len(names)))
+
+        for name in names:
+            self.add_index(name, closed=self.rand.random() < closed_ratio)
+
+    def add_index(self, name, closed=False, pri=None, rep=None):
+        docs = self.rand.randint(0, 50000000)
+        index = SyntheticIndex(name,
+            'close' if closed else 'open',
+            self.rand.choice(['green'] * 20 + ['yellow']),
+            pri if pri is not None else self.shards,
+            rep if rep is not None else self.replicas,
+            docs,
+            self.rand.randint(0, docs // 100 + 1),
+            docs * self.rand.randint(200, 800),
+            [self.rand.randint(1, self.max_segments) for s in range(pri if pri is not None else self.shards)])
+        self.indices[name] = index
+        return index
+
+    def newest_indices(self):
+        """ The write index of each family, the one with the latest name """
+        newest = {}
+        for name in self.indices:
+            for prefix, fmt, step in FAMILIES:
+                if name.startswith(prefix) and name[len(prefix):len(prefix) + 1].isdigit():
+                    if name > newest.get(prefix, ""):
+                        newest[prefix] = name
+                    break
+        return [self.indices[name] for name in newest.values()]
+
+    def ingest(self, docs):
+        """ Index docs more documents into each newest index, so they show up as hot """
+        for index in self.newest_indices():
+            if index.status == 'open':
+                index.docs_count += docs
+                index.pri_store_size += docs * 400
+
+    def sorted_indices(self):
+        return [self.indices[name] for name in sorted(self.indices)]
+
+    def cat_indices_json(self):
+        return [index.cat_indices_row() for index in self.sorted_indices()]
+
+    def cat_indices_text(self):
+        """ es 1.7 style plain text, default columns, sizes in bytes """
+        lines = []
+        for index in self.sorted_indices():
+            if index.status == 'close':
+                lines.append("       close  %s" % (index.name))
+            else:
+                lines.append("%-6s %-6s %s %3d %3d %12d %10d %14d %14d" % (index.health, index.status, index.name, index.pri, index.rep,
+                    index.docs_count, index.docs_deleted, index.store_size, index.pri_store_size))
+        return "\n".join(lines) + "\n"
+
+    def segment_rows(self):
+        """ Yields cat segments rows as dicts keyed by the cat column names, shard copies interleaved """
+        rand = random.Random(len(self.indices))
+        for index in self.sorted_indices():
+            if index.status == 'close':
+                continue
+            for shard, num_segments in enumerate(index.segments_per_shard):
+                for copy in range(1 + index.rep):
+                    prirep = 'p' if copy == 0 else 'r'
+                    ip = self.ips[(shard + copy) % len(self.ips)]
+                    seg_docs = index.docs_count // (index.pri * num_segments)
+                    seg_size = index.pri_store_size // (index.pri * num_segments)
+                    for seg in range(num_segments):
+                        yield {'index': index.name, 'shard': str(shard), 'prirep': prirep, 'ip': ip, 'segment': "_%s" % (seg),
+                            'generation': str(seg), 'docs.count': str(seg_docs), 'docs.deleted': str(rand.randint(0, 100)),
+                            'size': str(seg_size), 'size.memory': str(seg_size // 300), 'committed': 'true',
+                            'searchable': 'true', 'version': '4.10.4', 'compound': 'false'}
+
+    def cat_health_row(self, name="synthetic"):
+        open_indices = [i for i in self.indices.values() if i.status == 'open']
+        pri = sum(i.pri for i in open_indices)
+        status = 'yellow' if any(i.health == 'yellow' for i in open_indices) else 'green'
+        return {'cluster': name, 'status': status, 'node.total': str(len(self.ips)), 'node.data': str(len(self.ips)),
+                'shards': str(sum(i.pri * (1 + i.rep) for i in open_indices)), 'pri': str(pri),
+                'relo': '0', 'init': '0', 'unassign': '0'}
+
+    def shard_rows(self):
+        """ Yields cat shards rows as dicts keyed by the cat column names, on the same nodes as segment_rows """
+        for index in self.sorted_indices():
+            if index.status == 'close':
+                continue
+            for shard, num_segments in enumerate(index.segments_per_shard):
+                for copy in range(1 + index.rep):
+                    node = (shard + copy) % len(self.ips)
+                    yield {'index': index.name, 'shard': str(shard), 'prirep': 'p' if copy == 0 else 'r', 'state': 'STARTED',
+                        'docs': str(index.docs_count // index.pri), 'store': str(index.pri_store_size // index.pri),
+                        'ip': self.ips[node], 'node': "node-%d" % (node + 1)}
+
+    def cat_segments_json(self, columns=None):
+        if columns is None:
+            return list(self.segment_rows())
+        return [dict((c, row.get(c)) for c in columns) for row in self.segment_rows()]
+
+    def cat_segments_text(self, columns=None):
+        """ es 1.7 style plain text, the default columns or the ones asked for with h= """
+        return "\n".join(" ".join(row[c] for c in columns or CAT_SEGMENTS_COLUMNS) for row in self.segment_rows()) + "\n"
@@ -0,0 +1,141 @@
+""" Always on timing of the refresh stages, kept for the last TIMINGS_SIZE refreshes
+
+A RefreshCycle is one refresh: seconds spent per stage (http, parsing, merging, widget update,
+first render) and counts (rows, response bytes). Timings is the ring buffer of them that the
+stats popup summarizes and dumps. """
+import json
+import time
+import threading
+import collections
+
+# Refreshes kept for the stats popup
+TIMINGS_SIZE=100
+
+# Stages in the order they happen, for display
+STAGES = ['cat_indices_http', 'cat_indices_parse', 'cat_segments_http', 'cat_segments_parse', 'merge', 'save_state', 'update', 'render']
+
+_responses = threading.local()
+
+def note_response_size(size):
+    """ Called by the client's deserializer with the size of each response body """
+    _responses.size = size
+
+def last_response_size():
+    """ Size of the last response body deserialized on this thread, None if unknown """
+    return getattr(_responses, 'size', None)
+
+
+class StageTimer(object):
+    __slots__ = ['cycle', 'name', 'started']
+
+    def __init__(self, cycle, name):
+        self.cycle = cycle
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cycle.stages[self.name] = self.cycle.stages.get(self.name, 0.0) + time.time() - self.started
+        return False
+
+
+class RefreshCycle(object):
+    """ Timings of one refresh. Stages are timed with
+
+        with cycle.stage('merge'):
+            ...
+    """
+    def __init__(self):
+        self.started = time.time()
+        self.stages = {}
+        self.counts = {}
+
+    def stage(self, name):
+        return StageTimer(self, name)
+
+    def count(self, name, value):
+        if value is not None:
+            self.counts[name] = value
+
+    def total(self):
+        return sum(self.stages.values())
+
+    def as_dict(self):
+        """ A copy, safe to keep while the cycle is still being timed """
+        return {'started': self.started, 'stages': dict(self.stages), 'counts': dict(self.counts)}
+
+
+def percentile(values, pct):
+    """ Nearest rank percentile of a non empty list """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+class Timings(object):
+    """ The last TIMINGS_SIZE RefreshCycles. The fetch thread starts and fills in cycles while the
+    UI thread reads them, so readers work on copies of the cycles the fetch thread is done with. """
+    def __init__(self, size=TIMINGS_SIZE):
+        self.cycles = collections.deque(maxlen=size)
+        self.lock = threading.Lock()
+        # the cycle the fetch thread is still filling in
+        self.current = None
+
+    def start_cycle(self):
+        cycle = RefreshCycle()
+        with self.lock:
+            self.cycles.append(cycle)
+            self.current = cycle
+        return cycle
+
+    def finish_cycle(self, cycle):
+        """ The fetch thread is done with cycle, only the UI thread adds to it from here on """
+        with self.lock:
+            if self.current is cycle:
+                self.current = None
+
+    def snapshot(self):
+        """ Copies of the finished cycles, as_dict style """
+        with self.lock:
+            return [c.as_dict() for c in self.cycles if c is not self.current]
+
+    def stage_stats(self, cycles=None):
+        """ [(stage, samples, p50, p90, p99, max)] in seconds, stages never timed left out """
+        cycles = self.snapshot() if cycles is None else cycles
+        names = STAGES + sorted(set(name for c in cycles for name in c['stages']) - set(STAGES))
+        stats = []
+        for name in names:
+            values = [c['stages'][name] for c in cycles if name in c['stages']]
+            if values:
+                stats.append((name, len(values), percentile(values, 50), percentile(values, 90), percentile(values, 99), max(values)))
+        return stats
+
+    def count_stats(self, cycles=None):
+        """ [(count, last, p50, max)] """
+        cycles = self.snapshot() if cycles is None else cycles
+        stats = []
+        for name in sorted(set(name for c in cycles for name in c['counts'])):
+            values = [c['counts'][name] for c in cycles if name in c['counts']]
+            stats.append((name, values[-1], percentile(values, 50), max(values)))
+        return stats
+
+    def report(self):
+        """ Lines for the stats popup """
+        cycles = self.snapshot()
+        lines = ["%d refreshes" % (len(cycles)), "",
+                 "%-20s %7s %9s %9s %9s %9s" % ("stage", "samples", "p50 ms", "p90 ms", "p99 ms", "max ms")]
+        for name, samples, p50, p90, p99, top in self.stage_stats(cycles):
+            lines.append("%-20s %7d %9.1f %9.1f %9.1f %9.1f" % (name, samples, p50 * 1000, p90 * 1000, p99 * 1000, top * 1000))
+        lines.extend(["", "%-20s %12s %12s %12s" % ("count", "last", "p50", "max")])
+        for name, last, p50, top in self.count_stats(cycles):
+            lines.append("%-20s %12d %12d %12d" % (name, last, p50, top))
+        return lines
+
+    def dump(self, path):
+        """ Write every finished cycle kept as a json line to path """
+        cycles = self.snapshot()
+        with open(path, "w") as fh:
+            for cycle in cycles:
+                fh.write(json.dumps(cycle, sort_keys=True))
+                fh.write("\n")
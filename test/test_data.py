@@ -39,3 +39,213 @@ green  open   some_random_index_name3   5   0          0            0       720b
 
     eq_("green", c[0].health)
     eq_("close", c[1].status)
+
+def test_cat_response_from_json_columns():
+    c = esconsole.CatIndicesResponse([
+        {"health": "green", "status": "open", "index": "b", "pri": "5", "rep": "1", "docs.count": "10", "docs.deleted": "0", "store.size": "2000", "pri.store.size": "1000"},
+        {"health": None, "status": "close", "index": "a", "pri": None, "rep": None, "docs.count": None, "docs.deleted": None, "store.size": None, "pri.store.size": None},
+    ])
+
+    eq_(2, len(c))
+    eq_("a", c[0].index)
+    eq_(None, c[0].docs_count)
+    eq_(10, c[1].docs_count)
+    eq_(1000, c[1].pri_store_size)
+
+def test_segment_stats_from_ungrouped_rows():
+    s = esconsole.CatSegmentsResponse([
+        {"index": "a", "shard": "0", "prirep": "p", "committed": "true", "size.memory": "100", "docs.deleted": "1"},
+        {"index": "b", "shard": "0", "prirep": "p", "committed": "true", "size.memory": "100", "docs.deleted": "0"},
+        {"index": "a", "shard": "1", "prirep": "p", "committed": "true", "size.memory": "100", "docs.deleted": "0"},
+        {"index": "a", "shard": "0", "prirep": "p", "committed": "true", "size.memory": "100", "docs.deleted": "2"},
+        {"index": "a", "shard": "0", "prirep": "r", "committed": "true", "size.memory": "100", "docs.deleted": "0"},
+        {"index": "a", "shard": "1", "prirep": "p", "committed": "false", "size.memory": "100", "docs.deleted": "0"},
+    ])
+
+    eq_("1 - 2", str(s.get("a")))
+    eq_(300, s.get("a").size_memory)
+    eq_(3, s.get("a").docs_deleted)
+    eq_("1", str(s.get("b")))
+    eq_(None, s.get("c"))
+
+def test_age_on_other_naming_schemes():
+    now = datetime.datetime.now()
+    for name in [(now - datetime.timedelta(days=3)).strftime("logstash-%Y.%m.%d"),
+                 (now - datetime.timedelta(days=3, hours=1)).strftime("metrics-%Y.%m.%d-%H")]:
+        i = esconsole.IndexInfo(esconsole.CatIndicesResponseLine("green open %s 5 0 0 0 720b 720b" % name), now)
+        eq_(i.age, 3)
+
+    eq_(None, esconsole.index_naming.parse("logstash-not-a-date"))
+
+def test_chunk_index_names():
+    names = ["index-%03d" % i for i in range(100)]
+    chunks = esconsole.chunk_index_names(names, max_length=100)
+    eq_(names, sum(chunks, []))
+    ok_(all(len(",".join(c)) <= 100 for c in chunks))
+
+def test_batch_operation_pins_failures_on_single_indices():
+    import os
+    calls = []
+    def operation(names):
+        calls.append(names)
+        if "bad" in names.split(","):
+            raise Exception("no such index")
+
+    batch = esconsole.BatchOperationThread("delete", operation, ["a", "bad", "c"])
+    rd, batch.notify_fd = os.pipe()
+    batch.run()
+    os.close(rd)
+    os.close(batch.notify_fd)
+
+    eq_(["a,bad,c", "a", "bad", "c"], calls)
+    eq_("no such index", batch.results["bad"])
+    eq_(None, batch.results["a"])
+
+    # a chunk of one is already a single index, it is sent once
+    del calls[:]
+    batch = esconsole.BatchOperationThread("create", operation, ["a", "bad"], chunk_length=0)
+    rd, batch.notify_fd = os.pipe()
+    batch.run()
+    os.close(rd)
+    os.close(batch.notify_fd)
+
+    eq_(["a", "bad"], calls)
+    eq_("no such index", batch.results["bad"])
+
+def test_rates_from_history():
+    history = esconsole.IndexHistory()
+    for t, docs, size in [(0, 0, 1000), (10, 100, 2000), (20, 100, 1500), (30, 300, 2500)]:
+        i = esconsole.IndexInfo(esconsole.CatIndicesResponseLine("green open a 1 0 %d 0 %d %d" % (docs, size, size)))
+        history.add(t, i)
+
+    eq_(10.0, history.docs_rate())
+    eq_(50.0, history.bytes_rate())
+    eq_(500 / 30.0, history.merge_rate())
+    eq_(3, len(history.sparkline()))
+
+    for t in range(100):
+        history.add(100 + t, i)
+    eq_(esconsole.HISTORY_SIZE, len(history.samples))
+
+def test_closed_index_loses_its_previous_state():
+    def snapshot(line, timestamp):
+        info = esconsole.IndicesInfo(esconsole.CatIndicesResponse(line), esconsole.CatSegmentsResponse(""))
+        info.timestamp = timestamp
+        return info
+
+    store = esconsole.SnapshotStore()
+    for t in range(3):
+        latest = snapshot("green open a 1 0 %d 0 1000 1000" % (t * 10), t)
+        store.record(latest)
+    eq_("hot", latest[0].hot)
+    for t in range(3, 6):
+        latest = snapshot("close a", t)
+        store.record(latest)
+    eq_(None, latest[0].prev_state)
+    eq_(None, latest[0].docs_rate)
+    eq_("?", latest[0].hot)
+
+    # reopened, it starts over
+    latest = snapshot("green open a 1 0 100 0 1000 1000", 6)
+    store.record(latest)
+    eq_(None, latest[0].prev_state)
+
+def test_snapshot_store_does_not_keep_old_refreshes_alive():
+    import gc
+    import weakref
+
+    def snapshot(docs, timestamp):
+        info = esconsole.IndicesInfo(esconsole.CatIndicesResponse("green open a 1 0 %d 0 1000 1000\ngreen open b 1 0 0 0 1000 1000" % docs), esconsole.CatSegmentsResponse(""))
+        info.timestamp = timestamp
+        return info
+
+    store = esconsole.SnapshotStore()
+    first = snapshot(0, 1)
+    store.record(first)
+    first_ref = weakref.ref(first)
+    eq_("?", first[0].hot)
+    del first
+
+    for t in range(2, 200):
+        latest = snapshot(t, t)
+        store.record(latest)
+    gc.collect()
+
+    ok_(first_ref() is None)
+    eq_("hot", latest[0].hot)
+    eq_("", latest[1].hot)
+    eq_(esconsole.HISTORY_SIZE, len(store))
+    eq_(esconsole.HISTORY_SIZE, len(store.indices["a"].samples))
+
+def test_saved_state_round_trip_seeds_previous_state():
+    import shutil
+    import tempfile
+    from esconsole import statefile
+    from esconsole import synthetic
+
+    cluster = synthetic.SyntheticCluster(100, closed_ratio=0.1, max_segments=3)
+    def fetch():
+        return esconsole.IndicesInfo(esconsole.CatIndicesResponse(cluster.cat_indices_json()),
+            esconsole.CatSegmentsResponse(cluster.cat_segments_json(esconsole.CatSegmentsResponseLine.columns)))
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = statefile.state_path("localhost:9200", tmp_dir)
+        eq_(None, statefile.load_state(path))
+
+        saved = fetch()
+        saved.timestamp -= 60
+        statefile.save_state(path, saved)
+        loaded = statefile.load_state(path)
+        ok_(loaded.stale)
+        eq_(saved.timestamp, loaded.timestamp)
+        eq_([i.values(saved.headers) for i in saved], [i.values(saved.headers) for i in loaded])
+        eq_(None, statefile.load_state(path, max_age=30))
+
+        store = esconsole.SnapshotStore()
+        store.record(loaded)
+        cluster.indices["app-00000"].docs_count += 10
+        live = fetch()
+        store.record(live)
+        eq_("hot", live.get("app-00000").hot)
+        eq_("", live.get("app-00001").hot)
+
+        with open(path, "r+b") as fh:
+            fh.truncate(100)
+        eq_(None, statefile.load_state(path))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_next_time_bins_of_a_family_of_one():
+    cat = esconsole.CatIndicesResponse("green open metrics-2026.10.18-00 1 0 0 0 1b 1b\ngreen open 2015-10-10t06:00:00.000z 1 0 0 0 1b 1b")
+    info = esconsole.IndicesInfo(cat, esconsole.CatSegmentsResponse(""))
+    # hourly by its format, even at hour 00
+    eq_(["metrics-2026.10.18-01", "metrics-2026.10.18-02"], esconsole.next_time_bins(info, info.get("metrics-2026.10.18-00"), 2))
+    eq_(["2015-10-10t07:00:00.000z"], esconsole.next_time_bins(info, info.get("2015-10-10t06:00:00.000z"), 1))
+
+def test_next_time_bins_of_monthly_and_full_timestamp_indices():
+    esconsole.index_naming.add("monthly-", "%Y.%m")
+    try:
+        cat = esconsole.CatIndicesResponse("green open monthly-2015.12 1 0 0 0 1b 1b\ngreen open 2015-10-10t00:00:00.000z 1 0 0 0 1b 1b")
+        info = esconsole.IndicesInfo(cat, esconsole.CatSegmentsResponse(""))
+        eq_(["monthly-2016.01", "monthly-2016.02"], esconsole.next_time_bins(info, info.get("monthly-2015.12"), 2))
+        eq_(["2015-10-11t00:00:00.000z"], esconsole.next_time_bins(info, info.get("2015-10-10t00:00:00.000z"), 1))
+    finally:
+        esconsole.index_naming.remove("monthly-", "%Y.%m")
+    eq_(None, esconsole.index_naming.parse("monthly-2015.12"))
+    ok_("monthly-" not in esconsole.index_naming.by_prefix)
+
+def test_parse_scope():
+    eq_(["logstash-*", "-*.09.*"], esconsole.parse_scope(" logstash-*, -*.09.* "))
+    eq_([], esconsole.parse_scope(""))
+    eq_("*,-logstash-*", esconsole.scope_index(["-logstash-*"]))
+    eq_("logstash-*,-*.09.*", esconsole.scope_index(["logstash-*", "-*.09.*"]))
+    eq_(None, esconsole.scope_index([]))
+
+def test_segments_text_in_columns_order():
+    eq_(['index', 'shard', 'prirep', 'committed', 'size.memory', 'docs.deleted'], esconsole.CatSegmentsResponseLine.columns)
+    line = esconsole.CatSegmentsResponseLine("a 0 p true 1.5kb 2")
+    eq_(("a", 0, "p", "true", 1536, 2), (line.index, line.shard, line.prirep, line.committed, line.size_memory, line.docs_deleted))
+    # sizes are parsed and shown in the same units
+    eq_("1.5kb", esconsole.byte_format(line.size_memory).strip())
+    eq_("3mb", esconsole.byte_format(3 * 1024 * 1024).strip())
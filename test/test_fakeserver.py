@@ -0,0 +1,337 @@
+import os
+import time
+import threading
+
+import elasticsearch
+
+from esconsole import esconsole
+from esconsole import synthetic
+from esconsole.fakeserver import FakeServer, FakeCluster, Faults
+
+from nose.tools import eq_, ok_
+
+SCREEN_SIZE = (200, 40)
+
+
+class HeadlessMain(object):
+    """ What IndicesListWidget needs of its cluster tab, with refreshes and batches run synchronously """
+    def __init__(self, es):
+        self.es = es
+        self.status_line = esconsole.StatusLineWidget()
+        self.indices_list = None
+        self.reports = []
+        self.scope = []
+
+    def refresh(self):
+        self.indices_list.update(esconsole.fetch_indices_info(self.es, scope=self.scope))
+        self.indices_list.render(SCREEN_SIZE, focus=True)
+
+    def run_batch(self, batch):
+        read_fd, batch.notify_fd = os.pipe()
+        try:
+            batch.run()
+        finally:
+            os.close(read_fd)
+            os.close(batch.notify_fd)
+        self.reports.append(batch.report())
+        self.refresh()
+
+    def set_scope(self, scope):
+        self.scope = scope
+        self.refresh()
+
+    def run_in_background(self, func, callback):
+        try:
+            result, error = func(), None
+        except Exception as e:
+            result, error = None, e
+        callback(result, error)
+
+    def popup_report(self, lines):
+        self.reports.append(lines)
+
+
+# one server for the module, each test gives it a fresh cluster with start()
+server = None
+
+def setup_module():
+    global server
+    server = FakeServer(FakeCluster(synthetic.SyntheticCluster(0), "fake")).start()
+
+def teardown_module():
+    server.shutdown()
+    server.server_close()
+
+def start(num_indices=100, **faults):
+    cluster = synthetic.SyntheticCluster(num_indices, closed_ratio=0.1, max_segments=3)
+    fake = FakeCluster(cluster, "fake", Faults(**faults))
+    server.fake = fake
+    es = elasticsearch.Elasticsearch([server.address], timeout=5)
+    main = HeadlessMain(es)
+    main.indices_list = esconsole.IndicesListWidget(main, es, esconsole.fetch_indices_info(es))
+    return fake, main
+
+def test_list_against_fake_server():
+    fake, main = start(ingest_docs=10)
+    widget = main.indices_list
+    eq_(100, len(widget.indices_info))
+    eq_("fake", esconsole.fetch_cat_health(main.es).cluster)
+
+    main.refresh()
+    newest = [i.name for i in fake.cluster.newest_indices()]
+    ok_(newest)
+    eq_("hot", widget.indices_info.get(newest[0]).hot)
+
+    # a delete where one index fails ends up reported against that index only
+    names = [i.index for i in widget.indices_info][:3]
+    fake.faults.fail_indices.add(names[1])
+    widget.multilistbox.selection.select(names)
+    widget.delete_selected_indices_answer('y')
+    eq_(names[1:2], [i.index for i in widget.indices_info if i.index in names])
+    ok_("1 failed" in main.reports[-1][0])
+
+def test_injected_latency_and_throttling():
+    fake, main = start(endpoint_latency={'cat_segments': 0.3}, max_concurrent=1)
+    start_time = time.time()
+    main.refresh()
+    ok_(time.time() - start_time >= 0.3)
+
+    errors = []
+    def fetch():
+        try:
+            esconsole.fetch_cat_segments(main.es)
+        except elasticsearch.TransportError as e:
+            errors.append(e.status_code)
+    threads = [threading.Thread(target=fetch) for n in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    ok_(429 in errors)
+
+def test_refresh_timings():
+    import json
+    import tempfile
+    from esconsole.timings import Timings
+
+    fake, main = start()
+    es = elasticsearch.Elasticsearch([server.address], serializer=esconsole.CountingJSONSerializer())
+    timings = Timings()
+    for n in range(3):
+        cycle = timings.start_cycle()
+        indices_info = esconsole.fetch_indices_info(es, cycle)
+        timings.finish_cycle(cycle)
+        main.indices_list.update(indices_info, cycle)
+        main.indices_list.render(SCREEN_SIZE, focus=True)
+
+    stages = dict((stats[0], stats[1]) for stats in timings.stage_stats())
+    eq_(dict((name, 3) for name in ['cat_indices_http', 'cat_indices_parse', 'cat_segments_http', 'cat_segments_parse', 'merge', 'update', 'render']), stages)
+    counts = dict((stats[0], stats[1]) for stats in timings.count_stats())
+    eq_(100, counts['cat_indices_rows'])
+    ok_(counts['cat_segments_bytes'] > counts['cat_indices_bytes'] > 0)
+
+    # a cycle still being fetched isn't shown
+    timings.start_cycle().stages['cat_indices_http'] = 1.0
+    eq_(3, timings.stage_stats()[0][1])
+
+    with tempfile.NamedTemporaryFile(mode="r") as fh:
+        timings.dump(fh.name)
+        eq_(3, len([json.loads(line) for line in fh]))
+
+def test_optimize_scheduler_caps_merges_per_node():
+    from esconsole.optimize import OptimizeScheduler
+
+    fake, main = start(merge_seconds=0.2)
+    # one shard and no replicas puts them all on node-1
+    for n in range(3):
+        fake.cluster.add_index("merge-%d" % (n), pri=1, rep=0).segments_per_shard = [5]
+
+    scheduler = OptimizeScheduler(main.es, max_merges=2, max_merges_per_node=1)
+    scheduler.enqueue(["merge-0", "merge-1", "merge-2", "gone"], 1)
+    finished, started = scheduler.step()
+    # one at a time on node-1, and the missing index fails
+    eq_(["merge-0"], [job.index for job in started])
+    states = scheduler.states()
+    eq_("merging", states["merge-0"])
+    eq_("queued 1", states["merge-1"])
+    eq_("failed: index is gone", states["gone"])
+
+    time.sleep(0.05)
+    finished, started = scheduler.step()
+    eq_([], finished)
+    eq_("merging 5>1", scheduler.states()["merge-0"])
+
+    time.sleep(0.3)
+    finished, started = scheduler.step()
+    eq_(["merge-0"], [job.index for job in finished])
+    eq_(["merge-1"], [job.index for job in started])
+    eq_("optimize: 1 merging, 1 queued, 1 done, 1 failed", scheduler.summary())
+    eq_([1], fake.cluster.indices["merge-0"].segments_per_shard)
+
+    scheduler.cancel(["merge-2"])
+    ok_("merge-2" not in scheduler.states())
+
+    info = esconsole.fetch_indices_info(main.es)
+    info.set_optimize_states(scheduler.states())
+    ok_('optimize' in info.headers)
+    eq_("done", info.get("merge-0").optimize)
+
+def test_create_next_time_bins():
+    fake, main = start()
+    widget = main.indices_list
+    eq_("metrics-2026.10.18-00", max(name for name in fake.cluster.indices if name.startswith("metrics-")))
+    main.refresh()
+
+    widget.create_time_bins(False, widget.indices_info.get("metrics-2026.10.17-23"), 3, 2, 0)
+    eq_("create 2 of the next 3 bins, 1 exist already: 2 of 2 indices ok, 0 failed", main.reports[-1][0])
+    for name in ["metrics-2026.10.18-01", "metrics-2026.10.18-02"]:
+        eq_(2, widget.indices_info.get(name).pri)
+    eq_(None, widget.indices_info.get("metrics-2026.10.18-03"))
+
+def test_index_detail_drill_down():
+    fake, main = start()
+    widget = main.indices_list
+    index = fake.cluster.add_index("detail", pri=2, rep=1)
+    index.segments_per_shard = [3, 4]
+    main.refresh()
+
+    detail = esconsole.fetch_index_detail(main.es, "detail")
+    eq_(4, len(detail.shards))
+    eq_([(0, 'p', 3), (0, 'r', 3), (1, 'p', 4), (1, 'r', 4)], [stats[:2] + stats[3:4] for stats in detail.copy_stats()])
+
+    # enter fetches once, then shows the cached detail
+    widget.multilistbox.walker.set_focus(widget.multilistbox.visible.index("detail"))
+    del fake.requests[:]
+    widget.keypress(SCREEN_SIZE, 'enter')
+    widget.keypress(SCREEN_SIZE, 'enter')
+    eq_(2, len([path for method, path in fake.requests if path.startswith("/_cat/")]))
+    eq_(main.reports[-1], main.reports[-2])
+    ok_(main.reports[-1][0].startswith("detail, fetched"))
+
+    cache = esconsole.DetailCache(ttl=60, size=2)
+    for name in ["a", "b", "c"]:
+        cache.put(esconsole.IndexDetail(name, [], []))
+    eq_(None, cache.get("a"))
+    eq_("b", cache.get("b").index)
+    cache.details["b"].fetched -= 61
+    eq_(None, cache.get("b"))
+
+    del fake.requests[:]
+    info = esconsole.fetch_indices_info(main.es, segments=False)
+    eq_(101, len(info))
+    eq_([], [path for method, path in fake.requests if path.startswith("/_cat/segments")])
+
+def test_server_side_scope():
+    fake, main = start()
+    widget = main.indices_list
+
+    widget.multilistbox.filter(r"10\.18-00")
+    del fake.requests[:]
+    widget.scope_answer(False, "metrics-*,-metrics-2026.10.17-*")
+    eq_(["/_cat/indices/metrics-*,-metrics-2026.10.17-*", "/_cat/segments/metrics-*,-metrics-2026.10.17-*"], [path for method, path in fake.requests])
+    ok_(all(i.index.startswith("metrics-2026.10.18-") for i in widget.indices_info))
+    # the regex filter applies on top of the scope
+    eq_(["metrics-2026.10.18-00"], widget.multilistbox.visible)
+    ok_(main.status_line.info.startswith("scope metrics-*,-metrics-2026.10.17-*"))
+
+    widget.scope_answer(False, "")
+    eq_(100, len(widget.indices_info))
+
+def test_follow_up_requested_while_fetching_follows_it():
+    fake, main = start(latency=0.2)
+    fetcher = esconsole.IndicesFetchThread(main.es)
+    read_fd, fetcher.notify_fd = os.pipe()
+    fetcher.start()
+    ok_(fetcher.request_refresh())
+    time.sleep(0.05)
+    # a plain request is served by the running fetch
+    ok_(not fetcher.request_refresh())
+    os.read(read_fd, 1)
+    eq_(100, len(fetcher.take_result()[0]))
+    ok_(not fetcher.busy)
+
+    ok_(fetcher.request_refresh())
+    time.sleep(0.05)
+    fetcher.scope = ["metrics-*"]
+    ok_(not fetcher.request_refresh(follow_up=True))
+    ok_(not fetcher.request_refresh(follow_up=True))
+    ok_(not fetcher.request_refresh())
+
+    os.read(read_fd, 1)
+    eq_(100, len(fetcher.take_result()[0]))
+    os.read(read_fd, 1)
+    eq_(25, len(fetcher.take_result()[0]))
+    ok_(not fetcher.busy)
+    os.close(read_fd)
+
+def test_optimize_scheduler_notifies_when_jobs_go():
+    from esconsole import optimize
+
+    fake, main = start()
+    fake.cluster.add_index("merge-0", pri=1, rep=0).segments_per_shard = [1]
+    scheduler = optimize.OptimizeScheduler(main.es)
+    read_fd, scheduler.notify_fd = os.pipe()
+    scheduler.enqueue(["merge-0"], 1)
+    job = scheduler.jobs["merge-0"]
+    job.set_state('done')
+    job.changed -= 2 * optimize.MERGE_DONE_SHOWN
+    eq_(([], []), scheduler.step())
+    eq_(b"m", os.read(read_fd, 1))
+    eq_("", scheduler.summary())
+
+    scheduler.enqueue(["gone"], 1)
+    scheduler.step()
+    eq_(b"m", os.read(read_fd, 1))
+    eq_("failed: index is gone", scheduler.states()["gone"])
+    os.close(read_fd)
+    os.close(scheduler.notify_fd)
+
+def test_optimize_cancelled_while_starting_is_not_sent():
+    from esconsole.optimize import OptimizeScheduler
+
+    fake, main = start(endpoint_latency={'cat_shards': 0.3})
+    fake.cluster.add_index("merge-0", pri=1, rep=0).segments_per_shard = [5]
+    scheduler = OptimizeScheduler(main.es)
+    scheduler.enqueue(["merge-0"], 1)
+    canceller = threading.Timer(0.1, scheduler.cancel, [["merge-0"]])
+    canceller.start()
+    finished, started = scheduler.step()
+    canceller.join()
+    eq_([], started)
+    eq_({}, scheduler.states())
+    eq_([], [path for method, path in fake.requests if "forcemerge" in path])
+
+class FakeLoop(object):
+    """ What ClusterWidget.start needs of the urwid main loop, alarms are fired by hand """
+    def __init__(self):
+        self.alarms = []
+        self.pipes = []
+
+    def set_alarm_in(self, seconds, callback):
+        self.alarms.append((seconds, callback))
+
+    def watch_pipe(self, callback):
+        read_fd, write_fd = os.pipe()
+        self.pipes.append((read_fd, callback))
+        return write_fd
+
+def test_clusters_refresh_on_their_own():
+    fake, main = start()
+    cluster = esconsole.ClusterWidget(None, "fake", [server.address])
+    cluster.fetcher.state_path = None
+    loop = FakeLoop()
+    cluster.start(loop)
+    read_fd, indices_fetched = loop.pipes[0]
+    os.read(read_fd, 1)
+    indices_fetched(b"x")
+    eq_(100, cluster.totals()[0])
+
+    main.es.indices.delete(index=[i.index for i in main.indices_list.indices_info][0])
+    seconds, update_indices = loop.alarms[-1]
+    eq_(esconsole.INDICES_UPDATE_FREQ, seconds)
+    update_indices(loop, None)
+    os.read(read_fd, 1)
+    indices_fetched(b"x")
+    eq_(99, cluster.totals()[0])
+    # and again after another while
+    eq_(update_indices, loop.alarms[-1][1])
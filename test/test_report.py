@@ -0,0 +1,51 @@
+import io
+import sys
+import json
+import subprocess
+
+from esconsole import report
+from esconsole import synthetic
+from esconsole.indexdata import CatIndicesResponse, CatSegmentsResponse, CatSegmentsResponseLine, IndicesInfo
+
+from nose.tools import eq_, ok_
+
+def make_indices_info(n):
+    cluster = synthetic.SyntheticCluster(n, closed_ratio=0.1, max_segments=3)
+    return IndicesInfo(CatIndicesResponse(cluster.cat_indices_json()),
+        CatSegmentsResponse(cluster.cat_segments_json(CatSegmentsResponseLine.columns)))
+
+def test_report_formats():
+    info = make_indices_info(20)
+    fields = ['index', 'status', 'docs_count', 'age', 'segments']
+
+    out = io.StringIO() if sys.version_info[0] > 2 else io.BytesIO()
+    report.write_json(info, fields, out)
+    rows = [json.loads(line) for line in out.getvalue().splitlines()]
+    eq_([i.index for i in info], [row['index'] for row in rows])
+    closed = [row for row in rows if row['status'] == 'close']
+    ok_(closed)
+    eq_(None, closed[0]['docs_count'])
+
+    out = io.StringIO() if sys.version_info[0] > 2 else io.BytesIO()
+    report.write_csv(info, fields, out)
+    lines = out.getvalue().splitlines()
+    eq_(",".join(fields), lines[0])
+    eq_(21, len(lines))
+
+def test_report_does_not_import_urwid():
+    code = "import sys; from esconsole import report; print('urwid' in sys.modules)"
+    eq_("False", subprocess.check_output([sys.executable, "-c", code]).decode().strip())
+
+def test_report_against_a_given_cluster():
+    from esconsole.fakeserver import FakeServer, FakeCluster
+
+    server = FakeServer(FakeCluster(synthetic.SyntheticCluster(30))).start()
+    try:
+        out = io.StringIO() if sys.version_info[0] > 2 else io.BytesIO()
+        eq_(0, report.main(["--report", "fake=%s" % (server.address), "--format", "json", "--scope", "logstash-*"], out))
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        ok_(rows)
+        ok_(all(row['index'].startswith("logstash-") for row in rows))
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,25 @@
+from esconsole import esconsole
+from esconsole import synthetic
+
+from nose.tools import eq_, ok_
+
+def test_synthetic_cluster_parses():
+    cluster = synthetic.SyntheticCluster(200, closed_ratio=0.1, max_segments=3)
+    indices = esconsole.CatIndicesResponse(cluster.cat_indices_json())
+    eq_(200, len(indices))
+    closed = [i for i in indices if i.status == 'close']
+    ok_(len(closed) > 0)
+
+    text_indices = esconsole.CatIndicesResponse(cluster.cat_indices_text())
+    eq_([i.index for i in indices], [i.index for i in text_indices])
+    eq_([i.docs_count for i in indices], [i.docs_count for i in text_indices])
+
+    segments = esconsole.CatSegmentsResponse(cluster.cat_segments_json(esconsole.CatSegmentsResponseLine.columns))
+    eq_(200 - len(closed), len(segments))
+    text_segments = esconsole.CatSegmentsResponse(cluster.cat_segments_text(esconsole.CatSegmentsResponseLine.columns))
+    eq_(sorted(segments.index_stats), sorted(text_segments.index_stats))
+    eq_([str(segments.get(name)) for name in segments.index_stats], [str(text_segments.get(name)) for name in segments.index_stats])
+    eq_([segments.get(name).size_memory for name in segments.index_stats], [text_segments.get(name).size_memory for name in segments.index_stats])
+
+    info = esconsole.IndicesInfo(indices, segments)
+    ok_(any(i.age > 0 for i in info))
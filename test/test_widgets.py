@@ -0,0 +1,226 @@
+from esconsole import esconsole
+
+from nose.tools import eq_, ok_
+
+def make_indices_info(n, names=None):
+    names = names or ["index-%05d" % (i) for i in range(n)]
+    lines = ["green  open   %s   5   1   %d   0   %d   %d" % (name, i, i * 2000, i * 1000) for i, name in enumerate(names)]
+    return esconsole.IndicesInfo(esconsole.CatIndicesResponse("\n".join(lines)), esconsole.CatSegmentsResponse(""))
+
+def test_rows_are_built_lazily():
+    w = esconsole.MultiSelectListWidget(make_indices_info(5000))
+    w.render((160, 40), focus=True)
+    ok_(len(w.walker.cache) < 100)
+
+    w.keypress((160, 40), 'G')
+    w.render((160, 40), focus=True)
+    eq_(4999, w.item_under_cursor())
+    ok_(len(w.walker.cache) <= 2 * esconsole.ROW_CACHE_SIZE)
+
+def test_update_keeps_focus_and_selection_and_unchanged_widgets():
+    w = esconsole.MultiSelectListWidget(make_indices_info(100))
+    size = (160, 40)
+    w.render(size, focus=True)
+    for key in ['j', 'j', 'v', 'j']:
+        w.keypress(size, key)
+    w.render(size, focus=True)
+    untouched = w.walker.cached('index-00005')
+
+    # drop the first row and change the docs count of another
+    info = make_indices_info(100)
+    info.index_infos = info.index_infos[1:]
+    info.index_infos[9].cat_indices_info.docs_count = 12345
+    changed = w.walker.cached('index-00010')
+    w.update(info)
+    w.render(size, focus=True)
+
+    eq_(['index-00002'], w.selected())
+    eq_('index-00003', info[w.item_under_cursor()].index)
+    ok_(w.walker.cached('index-00005') is untouched)
+    ok_(w.walker.cached('index-00010') is not changed)
+
+def test_filter_narrows_and_survives_update():
+    w = esconsole.MultiSelectListWidget(make_indices_info(200))
+    w.filter("index-001")
+    eq_(100, len(w.visible))
+    w.filter("index-0015")
+    eq_(10, len(w.visible))
+    ok_(esconsole.filter_narrows("index-001", "index-0015"))
+    ok_(not esconsole.filter_narrows("index-001", "index-001|7"))
+
+    w.update(make_indices_info(200))
+    eq_(10, len(w.visible))
+    eq_(150, w.item_under_cursor())
+
+    w.filter("")
+    eq_(200, len(w.visible))
+
+def test_filter_anchors_to_each_cell():
+    w = esconsole.MultiSelectListWidget(make_indices_info(200))
+    w.filter("^index-001")
+    eq_(100, len(w.visible))
+    w.filter("^index-0015")
+    eq_(10, len(w.visible))
+    w.filter("^index-0015.*7$")
+    eq_(['index-00157'], w.visible)
+    # the docs count cell alone, not the name in front of it
+    w.filter("^199$")
+    eq_(['index-00199'], w.visible)
+
+def test_range_and_filter_selection():
+    w = esconsole.MultiSelectListWidget(make_indices_info(100))
+    size = (160, 40)
+    w.render(size, focus=True)
+    w.keypress(size, 'm')
+    for key in ['j', 'j', 'j', 'V']:
+        w.keypress(size, key)
+    eq_(['index-00000', 'index-00001', 'index-00002', 'index-00003'], w.selected())
+
+    w.keypress(size, 'c')
+    w.filter("index-0009")
+    w.keypress(size, '*')
+    w.filter("")
+    eq_(10, len(w.selection))
+
+    w.update(make_indices_info(95))
+    eq_(5, len(w.selection))
+
+def test_cells_are_reused_and_widths_follow_changes():
+    info = make_indices_info(10)
+    w = esconsole.MultiSelectListWidget(info)
+    cells = w.cells['index-00005']
+    width = w.col_width['docs_count']
+
+    info = make_indices_info(10)
+    info.index_infos[3].cat_indices_info.docs_count = 10 ** 15
+    w.update(info)
+    ok_(w.cells['index-00005'] is cells)
+    eq_(16, w.col_width['docs_count'])
+
+    w.update(make_indices_info(10))
+    eq_(width, w.col_width['docs_count'])
+
+def test_health_header_aggregates_clusters():
+    class Watcher(object):
+        def __init__(self, line):
+            self.health = esconsole.CatHealthResponseLine(line) if line else None
+            self.error = None if line else "unreachable: timed out"
+
+    class Cluster(object):
+        def __init__(self, name, line, totals):
+            self.name = name
+            self.health_watcher = Watcher(line)
+            self.indices_totals = totals
+
+        def totals(self):
+            return self.indices_totals
+
+    clusters = [
+        Cluster("prod", "prod green 3 3 35 15 0 0 0", (10, 1000, 2048)),
+        Cluster("logs", "logs yellow 2 2 20 10 0 1 5", (5, 500, 1024)),
+        Cluster("dead", None, (0, 0, 0)),
+    ]
+    header = esconsole.HealthDisplayWidget(clusters)
+    eq_(5, header.height())
+    header.set_current(1)
+    lines = header.textbox.text.split("\n")
+    eq_(5, len(lines))
+    ok_(lines[2].startswith(">"))
+    ok_("unreachable: timed out" in lines[3])
+    eq_(["total", "yellow", "5", "55", "0", "1", "5", "15", "1500", esconsole.byte_format(3072).strip()], lines[4].split())
+
+    eq_(("a=b", ["es1:9200", "es2:9200"]), esconsole.parse_cluster("a=b=es1:9200,es2:9200"))
+    eq_(("es1:9200", ["es1:9200"]), esconsole.parse_cluster("es1:9200"))
+
+def test_sort_and_top_n():
+    w = esconsole.MultiSelectListWidget(make_indices_info(200))
+    # typed, 9 comes before 10 and 199 after 1000
+    w.sort('docs_count')
+    eq_(['index-00000', 'index-00001', 'index-00002'], w.visible[:3])
+    w.sort('store_size', reverse=True)
+    eq_('index-00199', w.visible[0])
+    eq_(200, len(w.visible))
+
+    w.sort('store_size', reverse=True, top_n=5)
+    eq_(['index-00199', 'index-00198', 'index-00197', 'index-00196', 'index-00195'], w.visible)
+
+    # the top 5 are picked again from what the filter matches, and after an update
+    w.filter("index-000")
+    eq_(['index-00099', 'index-00098', 'index-00097', 'index-00096', 'index-00095'], w.visible)
+    info = make_indices_info(200)
+    info.get('index-00010').cat_indices_info.store_size = 10 ** 9
+    w.update(info)
+    eq_('index-00010', w.visible[0])
+    eq_(5, len(w.visible))
+
+    # no age to sort by, they keep their order after the rows that have one
+    w.filter("")
+    w.sort('age')
+    eq_(w.keys, w.visible)
+    w.sort(None)
+    eq_(w.keys, w.visible)
+
+def test_trend_cells_stay_text():
+    store = esconsole.SnapshotStore()
+    for n in range(3):
+        info = make_indices_info(3)
+        info.get('index-00002').cat_indices_info.docs_count = 2 + n * 100
+        info.timestamp = n * 10
+        store.record(info)
+    info.show_trend = True
+    w = esconsole.MultiSelectListWidget(info)
+    trend = w.cells['index-00002'][w.headers.index('trend')]
+    ok_(trend.strip() and all(ord(c) > 127 for c in trend.strip()))
+    w.render((200, 10), focus=True)
+
+def test_index_popups_pass_their_inputs():
+    class Loop(object):
+        widget = None
+
+    got = []
+    popup = esconsole.IndexInputPopup("create index", "logs", 5, 1, lambda *args: got.append(args))
+    popup.show_popup(esconsole.urwid.Text(""), Loop())
+    popup.keypress((60, 10), 'enter')
+    popup = esconsole.TimeBinsInputPopup("create the next bins", 3, 2, 0, lambda *args: got.append(args))
+    popup.show_popup(esconsole.urwid.Text(""), Loop())
+    popup.keypress((60, 10), 'esc')
+    eq_([(False, "logs", 5, 1), (True, 3, 2, 0)], got)
+
+def test_rollup_by_family():
+    class Main(object):
+        def __init__(self):
+            self.status_line = esconsole.StatusLineWidget()
+
+    size = (160, 40)
+    names = ["metrics-2026.10.17-21", "metrics-2026.10.17-22", "metrics-2026.10.17-23", "metrics-2026.10.18-00",
+             "app-00001", "app-00002", "kibana"]
+    widget = esconsole.IndicesListWidget(Main(), None, make_indices_info(0, names))
+    widget.keypress(size, 'f')
+    box = widget.multilistbox
+    eq_(["app-*", "kibana", "metrics-*"], sorted(box.keys))
+    group = widget.rollup.groups["metrics-*"]
+    eq_(4, len(group.members))
+    eq_(0 + 1 + 2 + 3, group.fields['docs_count'])
+    eq_((0 + 1 + 2 + 3) * 2000, group.fields['store_size'])
+    ok_(box.values["metrics-*"][2].startswith("+ metrics-* (4)"))
+
+    # members only get rows once their group is opened, and follow it when sorted
+    box.walker.set_focus(box.visible.index("metrics-*"))
+    widget.keypress(size, 'enter')
+    eq_(7, len(box.keys))
+    box.sort('docs_count', reverse=True)
+    position = box.visible.index("metrics-*")
+    eq_(names[:4], box.visible[position + 1:position + 5])
+
+    # a selected group stands for all its members, a selected member stays selected while closed
+    box.selection.select(["app-*", "metrics-2026.10.17-23"])
+    widget.keypress(size, 'enter')
+    eq_(3, len(box.keys))
+    eq_(3, widget.num_selected())
+    eq_(["app-00001", "app-00002", "metrics-2026.10.17-23"], sorted(i.index for i in widget.selected()))
+
+    # app-* down to one is a plain index row again
+    widget.update(make_indices_info(0, names[:5] + names[6:]))
+    ok_("app-00001" in box.keys)
+    widget.keypress(size, 'f')
+    eq_(6, len(box.keys))